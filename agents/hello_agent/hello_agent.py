@@ -1,13 +1,22 @@
-import requests
+import asyncio
+import atexit
+import logging
+import queue
 import json
+import re
 import time
 import uuid
 import os
-from flask import Flask, request, jsonify
+import random
+from logging.handlers import QueueHandler, QueueListener
+import httpx
 import openai
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 
-app = Flask(__name__)
+app = FastAPI(title="Hello Agent")
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,35 +24,80 @@ load_dotenv()
 # Configuration
 AGENT_ID = "hello-agent"  # Fixed ID to match the configuration
 API_KEY = os.getenv("OPENAI_API_KEY")
+WORKERS = int(os.getenv("AGENT_WORKERS", "1"))
+BATCH_CONCURRENCY = 16  # Max messages from one batch in flight at once
+
+# Log through a queue so request handlers never block on stdout; the
+# listener thread performs the actual writes
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_queue = queue.Queue(-1)
+log_listener = QueueListener(log_queue, log_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+logger = logging.getLogger(AGENT_ID)
+logger.setLevel(logging.INFO)
+logger.addHandler(QueueHandler(log_queue))
+logger.propagate = False
 
 # Initialize OpenAI client
 if not API_KEY:
     print("Error: OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
     exit(1)
 
-# Create a client instance with the API key
-client = openai.OpenAI(api_key=API_KEY)
+# Create a client instance with the API key, sharing one pooled HTTP/2
+# connection set across requests so calls skip repeated TLS handshakes
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=60),
+    http2=True,
+    timeout=httpx.Timeout(30.0, connect=5.0)
+)
+client = openai.AsyncOpenAI(api_key=API_KEY, http_client=http_client)
+
+# Greeting and language detection patterns, compiled once at import
+GREET_RE = re.compile(r"\b(?:hello|hi|greet\w*|bonjour|hola)\b", re.I)
+LANG_RE = re.compile(r"\b(french|spanish|german|italian|japanese|chinese)\b", re.I)
+
+# Generated greetings per language; once a language has GREETING_VARIANTS
+# entries, requests are served from the cache instead of calling the model
+GREETING_VARIANTS = 4
+greeting_cache = {}
+
+# Last formatted timestamp, reused until the second changes
+_last_timestamp = (0, "")
+
+def utc_timestamp():
+    """Return the current UTC time as an ISO 8601 string, formatting at most once per second."""
+    global _last_timestamp
+    now = int(time.time())
+    if _last_timestamp[0] != now:
+        _last_timestamp = (now, time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)))
+    return _last_timestamp[1]
 
-@app.route('/health', methods=['GET'])
-def health_check():
+@app.get('/health')
+async def health_check():
     """Health check endpoint"""
-    return jsonify({
+    return {
         "status": "healthy",
         "agent_id": AGENT_ID,
-        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-    }), 200
+        "timestamp": utc_timestamp()
+    }
 
-@app.route('/api/message', methods=['POST'])
-def receive_message():
+@app.post('/api/message')
+async def receive_message(request: Request):
     """Endpoint to receive messages"""
-    message = request.json
+    try:
+        message = await request.json()
+    except ValueError:
+        message = None
     
     if not message:
-        return jsonify({"error": "No message provided"}), 400
+        return JSONResponse({"error": "No message provided"}, status_code=400)
     
     # Process the message
     try:
-        response_content = process_message(message)
+        response_content = await process_message(message)
         
         # Prepare response message
         response = {
@@ -52,45 +106,72 @@ def receive_message():
             "senderId": AGENT_ID,
             "recipientId": message.get("senderId", ""),
             "content": response_content,
-            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "timestamp": utc_timestamp(),
             "type": "Text"
         }
         
         # Return the response directly to the caller
-        return jsonify(response), 200
+        return JSONResponse(response, status_code=200)
     except Exception as e:
-        print(f"Error processing message: {e}")
-        return jsonify({"error": str(e)}), 500
+        logger.exception("Error processing message")
+        return JSONResponse({"error": str(e)}, status_code=500)
 
-def process_message(message):
+@app.post('/api/message/batch')
+async def receive_message_batch(request: Request):
+    """Endpoint to receive several messages and answer them concurrently."""
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    messages = body.get("messages") if isinstance(body, dict) else None
+    
+    if not messages:
+        return JSONResponse({"error": "No messages provided"}, status_code=400)
+    
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def answer(message):
+        async with semaphore:
+            try:
+                response_content = await process_message(message)
+            except Exception as e:
+                logger.exception("Error processing batch message")
+                return {"error": str(e)}
+        return {
+            "messageId": str(uuid.uuid4()),
+            "conversationId": message.get("conversationId", ""),
+            "senderId": AGENT_ID,
+            "recipientId": message.get("senderId", ""),
+            "content": response_content,
+            "timestamp": utc_timestamp(),
+            "type": "Text"
+        }
+    
+    responses = await asyncio.gather(*(answer(message) for message in messages))
+    return JSONResponse({"responses": responses}, status_code=200)
+
+async def process_message(message):
     """Process the incoming message and generate a response"""
-    content = message.get("content", "").lower()
+    content = message.get("content", "")
     
     # Check if this is a greeting request
-    if any(keyword in content for keyword in ["hello", "hi ", "greet", "bonjour", "hola"]):
+    if GREET_RE.search(content):
         # Extract language if specified
-        language = None
-        if "french" in content:
-            language = "French"
-        elif "spanish" in content:
-            language = "Spanish"
-        elif "german" in content:
-            language = "German"
-        elif "italian" in content:
-            language = "Italian"
-        elif "japanese" in content:
-            language = "Japanese"
-        elif "chinese" in content:
-            language = "Chinese"
+        match = LANG_RE.search(content)
+        language = match.group(1).title() if match else None
         
         # Generate greeting
-        return generate_greeting(language)
+        return await generate_greeting(language)
     
     # Default response for unrelated queries
     return "Hello Agent: I can help you with greetings. Try asking me to say hello in a specific language."
 
-def generate_greeting(language=None):
+async def generate_greeting(language=None):
     """Generate a greeting in the specified language or provide options"""
+    cached = greeting_cache.setdefault(language, [])
+    if len(cached) >= GREETING_VARIANTS:
+        return random.choice(cached)
+    
     try:
         prompt = "Generate a friendly greeting"
         
@@ -100,27 +181,29 @@ def generate_greeting(language=None):
             prompt += " in English"
             
         # Using the newer OpenAI API format
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are a helpful assistant that generates friendly greetings."},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=50
+            max_tokens=30
         )
         
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Error generating greeting: {e}")
+        greeting = response.choices[0].message.content.strip()
+        cached.append(greeting)
+        return greeting
+    except Exception:
+        logger.exception("Error generating greeting")
         return f"Hello! (Sorry, I couldn't generate a greeting in {language if language else 'English'})"
 
 if __name__ == "__main__":
     print("Starting Hello Agent with ID:", AGENT_ID)
     
-    # Disable Flask access logs
-    import logging
-    log = logging.getLogger('werkzeug')
-    log.setLevel(logging.ERROR)
-    
-    # Run the Flask app
-    app.run(host="0.0.0.0", port=5001) 
\ No newline at end of file
+    # Multiple workers need an import string so each process loads its own app
+    if WORKERS > 1:
+        uvicorn.run("hello_agent:app", app_dir=os.path.dirname(os.path.abspath(__file__)),
+                    host="0.0.0.0", port=5001, workers=WORKERS, log_level="error")
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=5001, log_level="error")
+ 
\ No newline at end of file
@@ -1,66 +1,104 @@
 #!/usr/bin/env python3
 
 import asyncio
-import json
+import atexit
+import hashlib
 import time
 import uuid
 import os
 import logging
-from flask import Flask, request, jsonify, Response, stream_with_context
+import queue
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
+import httpx
+import orjson
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 
 from semantic_kernel import Kernel
 from semantic_kernel.connectors.ai.function_choice_behavior import FunctionChoiceBehavior
-from semantic_kernel.contents import ChatHistory
+from semantic_kernel.contents import ChatHistory, ChatMessageContent
 from semantic_kernel.contents.streaming_chat_message_content import StreamingChatMessageContent
 from semantic_kernel.contents.utils.author_role import AuthorRole
-from semantic_kernel.functions import KernelArguments
 
 # Import our custom plugin
 from plugins.math_plugin import MathPlugin
 
-app = Flask(__name__)
+app = FastAPI(title="Math Agent", default_response_class=ORJSONResponse)
 
 # Load environment variables from .env file
 load_dotenv()
 
 AGENT_ID = "math-agent"
 API_KEY = os.getenv("OPENAI_API_KEY")
+WORKERS = int(os.getenv("AGENT_WORKERS", "1"))
+BATCH_CONCURRENCY = 16  # Max messages from one batch in flight at once
+
+# Bounds for the completion budget; short questions get a smaller cap so the
+# request reserves less output capacity and returns its first token sooner
+MIN_OUTPUT_TOKENS = 512
+MAX_OUTPUT_TOKENS = 2000
+
+# Prompt budget for the chat history; the oldest turns are dropped past it
+MAX_HISTORY_TOKENS = 6000
+
+# SSE comment sent while waiting on the model's first token so proxies and
+# browsers keep the stream open; clients ignore comment lines
+SSE_HEARTBEAT = b":\n\n"
+HEARTBEAT_INTERVAL = 0.5
+
+# Queued after a streamed response's last chunk
+STREAM_DONE = object()
+
+# Log through a queue so request handlers never block on stdout; the
+# listener thread performs the actual writes
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_queue = queue.Queue(-1)
+log_listener = QueueListener(log_queue, log_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+logger = logging.getLogger(AGENT_ID)
+logger.setLevel(logging.INFO)
+logger.addHandler(QueueHandler(log_queue))
+logger.propagate = False
+
 if not API_KEY:
     print("Error: OpenAI API key not found. Please set the OPENAI_API_KEY environment variable.")
     exit(1)
 
+
+# Last formatted timestamp, reused until the second changes
+_last_timestamp = (0, "")
+
+
+def utc_timestamp():
+    """Return the current UTC time as an ISO 8601 string, formatting at most once per second."""
+    global _last_timestamp
+    now = int(time.time())
+    if _last_timestamp[0] != now:
+        _last_timestamp = (now, time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)))
+    return _last_timestamp[1]
+
 # Define the system message for the math agent
 SYSTEM_MESSAGE = """
-You are a specialized AI math assistant with the following capabilities:
-1. Breaking down complex math problems into steps by yourself
-2. Performing mathematical calculations using the plugin functions provided to you
-3. Thinking through problems carefully, step-by-step, identifying the core functions and logical steps
-4. ALWAYS using available math functions for calculations rather than doing them manually
-5. NEVER guess an answer, you MUST use the functions to calculate the answer
-
-EXTREMELY IMPORTANT: You MUST ACTUALLY INVOKE the math plugin functions for ANY calculation. 
-DO NOT just talk about using them - you MUST ACTUALLY CALL them.
-
-Even for simple calculations like 2+2 or sqrt(625), you MUST INVOKE the plugin functions.
-If you merely mention "I'll use math.Add" without actually calling it, the operation won't be performed.
-
-HOW TO SOLVE PROBLEMS:
-1. Start by thinking through the problem yourself considering what formula(s) may apply and asking clarifying questions when needed
-2. ALWAYS break down the problem into individual calculation steps
-3. For EACH step, you MUST INVOKE the appropriate math function
-4. You need to say AND do: "I need to [operation], so I'll call math.[Function]"
-5. At the end, always check your work before providing the final answer
-
-For example, to solve "What is 5 + 8 divided by 2?":
-- "First, I need to add 5 and 8, so I'll call math.Add(5, 8)" [ACTUALLY CALL THE FUNCTION]
-- "Next, I need to divide 13 by 2, so I'll call math.Divide(13, 2)" [ACTUALLY CALL THE FUNCTION]
-- "Therefore, 5 + 8 divided by 2 = 6.5."
-
-DO NOT EXPLAIN WITHOUT DOING. You MUST invoke the functions, not just talk about them.
-Always response in GitHub Flavored Markdown / LaTeX format.
+You are a math assistant. Break each problem into individual calculation steps
+and ACTUALLY CALL the math plugin function for every step, even trivial ones like
+2+2; never compute or guess results yourself, and do not merely describe a call.
+Ask clarifying questions when needed and check your work before the final answer.
+
+Example, "What is 5 + 8 divided by 2?": call math.Add(5, 8), then
+math.Divide(13, 2), then answer "5 + 8 divided by 2 = 6.5."
+
+Always respond in GitHub Flavored Markdown / LaTeX format.
 """
 
+# Prebuilt system message shared by reference across every chat history
+SYSTEM_CHAT_MESSAGE = ChatMessageContent(role=AuthorRole.SYSTEM, content=SYSTEM_MESSAGE)
+
 # Create a kernel for the agent
 kernel = Kernel()
 
@@ -68,13 +106,35 @@ kernel = Kernel()
 try:
     from semantic_kernel.connectors.ai.open_ai import OpenAIChatCompletion, OpenAIChatPromptExecutionSettings
     from semantic_kernel.filters import AutoFunctionInvocationContext, FilterTypes
+    from openai import AsyncOpenAI
+    
+    # Share one pooled HTTP/2 client across requests so calls to OpenAI
+    # reuse warm connections instead of paying a TLS handshake each time
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=60),
+        http2=True,
+        timeout=httpx.Timeout(30.0, connect=5.0)
+    )
     
     # Initialize chat service with appropriate settings
-    chat_service = OpenAIChatCompletion(service_id="chat-gpt", ai_model_id="gpt-4o", api_key=API_KEY)
+    chat_service = OpenAIChatCompletion(
+        service_id="chat-gpt",
+        ai_model_id="gpt-4o",
+        api_key=API_KEY,
+        async_client=AsyncOpenAI(api_key=API_KEY, http_client=http_client)
+    )
     
     # Add service to kernel
     kernel.add_service(chat_service)
     
+    # Execution settings with explicit function calling enabled, validated
+    # once here and shallow-copied per request
+    EXECUTION_SETTINGS = OpenAIChatPromptExecutionSettings(
+        service_id="chat-gpt",
+        function_choice_behavior=FunctionChoiceBehavior.Auto(),
+        max_tokens=MAX_OUTPUT_TOKENS
+    )
+    
     # Add a filter to track function calls
     @kernel.filter(filter_type=FilterTypes.AUTO_FUNCTION_INVOCATION)
     async def auto_function_invocation_filter(
@@ -102,186 +162,277 @@ except ImportError:
 # Add our math plugin to the kernel
 kernel.add_plugin(MathPlugin(), plugin_name="math")
 
-# Create a chat function for handling math queries
-chat_function = kernel.add_function(
-    prompt="{{$chat_history}}{{$user_input}}",
-    plugin_name="MathAgent",
-    function_name="SolveMathProblem",
-)
+# Chat histories kept per conversation so follow-up turns only append the
+# new messages. Each entry stores a hash of the client-visible turns it
+# represents; a mismatch with the incoming chatHistory forces a rebuild.
+MAX_CACHED_HISTORIES = 1024
+chat_histories: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def get_chat_history(conversation_id, chat_history, content):
+    """Return the ChatHistory for this turn and the client-visible turns it holds."""
+    turns = tuple(
+        (msg.get("role"), msg.get("content", ""))
+        for msg in chat_history
+        if msg.get("role") in ("user", "assistant")
+    )
+
+    # Take the cached history out while the turn is in flight so a
+    # concurrent request on the same conversation cannot share it
+    cached = chat_histories.pop(conversation_id, None) if conversation_id else None
+    if cached is not None and cached[0] == hash(turns):
+        history = cached[1]
+    else:
+        history = ChatHistory(messages=[SYSTEM_CHAT_MESSAGE])
+        for role, text in turns:
+            if role == "user":
+                history.add_user_message(text)
+            else:
+                history.add_assistant_message(text)
+
+    history.add_user_message(content)
+    trim_chat_history(history)
+    return history, turns + (("user", content),)
+
+
+def trim_chat_history(history):
+    """Drop the oldest turns until the history fits MAX_HISTORY_TOKENS, keeping the system message."""
+    messages = history.messages
+    total = sum(estimate_tokens(message.content) for message in messages)
+    while total > MAX_HISTORY_TOKENS:
+        # Remove a whole turn at once so tool calls stay paired with their results
+        end = next((i for i in range(2, len(messages)) if messages[i].role == AuthorRole.USER), None)
+        if end is None:
+            break
+        total -= sum(estimate_tokens(message.content) for message in messages[1:end])
+        del messages[1:end]
+
+
+def store_chat_history(conversation_id, history, turns, response):
+    """Record the assistant reply and cache the history for the next turn."""
+    if not conversation_id:
+        return
+
+    history.add_assistant_message(response)
+    chat_histories[conversation_id] = (hash(turns + (("assistant", response),)), history)
+    if len(chat_histories) > MAX_CACHED_HISTORIES:
+        chat_histories.popitem(last=False)
+
 
+def estimate_tokens(text):
+    """Approximate the token count of text at ~4 characters per token."""
+    return len(text or "") // 4 + 1
 
-@app.route('/api/message', methods=['POST'])
-def receive_message():
+
+def max_output_tokens(content):
+    """Scale the completion cap with the question."""
+    return min(MAX_OUTPUT_TOKENS, max(MIN_OUTPUT_TOKENS, 4 * estimate_tokens(content)))
+
+
+# Answers to recently solved questions, keyed on the normalized turns that
+# produced them, so repeated queries skip the LLM round-trip
+RESPONSE_CACHE_TTL = 3600
+MAX_CACHED_RESPONSES = 1024
+response_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def response_cache_key(turns):
+    """Build a cache key that ignores case and whitespace differences."""
+    normalized = "\n".join(f"{role}:{' '.join(text.lower().split())}" for role, text in turns)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def get_cached_response(key):
+    """Return a cached response if it has not expired."""
+    entry = response_cache.get(key)
+    if entry is None:
+        return None
+    if time.monotonic() - entry[0] > RESPONSE_CACHE_TTL:
+        del response_cache[key]
+        return None
+    response_cache.move_to_end(key)
+    return entry[1]
+
+
+def cache_response(key, response):
+    """Store a response, evicting the least recently used entry when full."""
+    response_cache[key] = (time.monotonic(), response)
+    response_cache.move_to_end(key)
+    if len(response_cache) > MAX_CACHED_RESPONSES:
+        response_cache.popitem(last=False)
+
+
+@app.post('/api/message')
+async def receive_message(request: Request):
     """Endpoint to receive messages from the runtime or external calls."""
     
-    message = request.json
+    try:
+        message = await request.json()
+    except ValueError:
+        message = None
     if not message:
-        return jsonify({"error": "No message provided"}), 400
+        return ORJSONResponse({"error": "No message provided"}, status_code=400)
 
     # Check if streaming is requested
     stream = message.get("stream", False)
 
     if stream:
-        return Response(
-            stream_with_context(process_message_stream(message)),
-            content_type='text/event-stream'
+        return StreamingResponse(
+            sse_stream(process_message_stream(message)),
+            media_type='text/event-stream',
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Accel-Buffering": "no",
+            }
         )
     else:
-        # Process synchronously
+        # Process on the server's event loop
         try:
-            response_content = process_message(message)
+            response_content = await process_message(message)
             response = {
                 "messageId": str(uuid.uuid4()),
                 "conversationId": message.get("conversationId", ""),
                 "senderId": AGENT_ID,
                 "recipientId": message.get("senderId", ""),
                 "content": response_content,
-                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "timestamp": utc_timestamp(),
                 "type": "Text"
             }
-            return jsonify(response), 200
+            return ORJSONResponse(response, status_code=200)
         except Exception as e:
-            print(f"Error processing message: {e}")
-            return jsonify({"error": str(e)}), 500
+            logger.exception("Error processing message")
+            return ORJSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.post('/api/message/batch')
+async def receive_message_batch(request: Request):
+    """Endpoint to receive several messages and answer them concurrently."""
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    messages = body.get("messages") if isinstance(body, dict) else None
+    
+    if not messages:
+        return ORJSONResponse({"error": "No messages provided"}, status_code=400)
+    
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def answer(message):
+        async with semaphore:
+            try:
+                response_content = await process_message(message)
+            except Exception as e:
+                logger.exception("Error processing batch message")
+                return {"error": str(e)}
+        return {
+            "messageId": str(uuid.uuid4()),
+            "conversationId": message.get("conversationId", ""),
+            "senderId": AGENT_ID,
+            "recipientId": message.get("senderId", ""),
+            "content": response_content,
+            "timestamp": utc_timestamp(),
+            "type": "Text"
+        }
+    
+    responses = await asyncio.gather(*(answer(message) for message in messages))
+    return ORJSONResponse({"responses": responses}, status_code=200)
 
 
-def stream_with_context(generator):
+async def sse_stream(generator):
     """Helper that yields SSE lines and ends with [DONE]."""
     try:
-        for chunk in generator:
-            yield f"data: {json.dumps(chunk)}\n\n"
-        yield "data: [DONE]\n\n"
+        async for chunk in generator:
+            # Pre-framed chunks and heartbeats pass through untouched
+            if isinstance(chunk, bytes):
+                yield chunk
+                continue
+            yield b"data: " + orjson.dumps(chunk) + b"\n\n"
+        yield b"data: [DONE]\n\n"
     except Exception as e:
-        print(f"Error in streaming: {e}")
-        yield f"data: {json.dumps({'error': str(e)})}\n\n"
-        yield "data: [DONE]\n\n"
+        logger.exception("Error in streaming")
+        yield b"data: " + orjson.dumps({"error": str(e)}) + b"\n\n"
+        yield b"data: [DONE]\n\n"
 
 
-def process_message_stream(message):
+async def process_message_stream(message):
     """Process a message from the client and stream the response."""
     content = message.get("content", "")
     conversation_id = message.get("conversationId", "")
     sender_id = message.get("senderId", "")
     message_id = str(uuid.uuid4())
 
-    # Create a chat history for the semantic kernel
-    history = ChatHistory()
-    history.add_system_message(SYSTEM_MESSAGE)
-    
-    # If chat history is provided, add it to the history
-    chat_history = message.get("chatHistory", [])
-    for msg in chat_history:
-        if msg.get("role") == "user":
-            history.add_user_message(msg.get("content", ""))
-        elif msg.get("role") == "assistant":
-            history.add_assistant_message(msg.get("content", ""))
-            
-    # Add user message
-    history.add_user_message(content)
-
-    # Yield an initial chunk to indicate the calculation has started
-    yield {
+    # Fields shared by every chunk of this response, serialized once per
+    # request as an SSE frame prefix that each chunk's own fields complete
+    prefix = b"data: " + orjson.dumps({
         "messageId": message_id,
         "conversationId": conversation_id,
         "senderId": AGENT_ID,
         "recipientId": sender_id,
-        "content": "",
-        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
         "type": "Text",
-        "chunk": "ƒ(x) calling math-agent...",
-        "complete": False
-    }
+    })[:-1] + b","
+
+    def emit(chunk_text, complete=False, content="", **extra):
+        fields = {"content": content, "timestamp": utc_timestamp(), "chunk": chunk_text, "complete": complete, **extra}
+        return prefix + orjson.dumps(fields)[1:] + b"\n\n"
+
+    # Yield an initial chunk before any other work so the client sees
+    # progress immediately
+    yield emit("ƒ(x) calling math-agent...")
+
+    # Get the chat history for the semantic kernel, including the user message
+    history, turns = get_chat_history(conversation_id, message.get("chatHistory", []), content)
     
     try:
-        # Setup execution settings with explicit function calling enabled
-        settings = OpenAIChatPromptExecutionSettings(
-            service_id="chat-gpt",
-            function_choice_behavior=FunctionChoiceBehavior.Auto(),
-            max_tokens=2000
-        )
+        # Copy the prebuilt settings; SK assigns per-call fields on them
+        settings = EXECUTION_SETTINGS.model_copy(update={"max_tokens": max_output_tokens(content)})
         
         # Set up for streaming
         accumulated_response = ""
         function_calls = []
         
-        # Create an asyncio event loop
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # Stream the response from chat service
-        for msg in loop.run_until_complete(
-            stream_sk_response(chat_service, history, settings)
-        ):
-            # Get the message content
-            chunk_text = str(msg)
+        cache_key = response_cache_key(turns)
+        cached_response = get_cached_response(cache_key)
+        if cached_response is not None:
+            # Answer repeated questions straight from the cache
+            accumulated_response = cached_response
+            yield emit(cached_response)
+        else:
+            # Stream the response from chat service
+            async for msg in first_token_heartbeats(stream_sk_response(chat_service, history, settings)):
+                if msg is SSE_HEARTBEAT:
+                    yield msg
+                    continue
+                
+                # Get the message content
+                chunk_text = str(msg)
             
-            # Check for function call markers in the text
-            if "ƒ(x) calling" in chunk_text:
-                function_calls.append(chunk_text)
+                # Check for function call markers in the text
+                if "ƒ(x) calling" in chunk_text:
+                    function_calls.append(chunk_text)
                 
-                # Yield the function call as a separate chunk
-                yield {
-                    "messageId": message_id,
-                    "conversationId": conversation_id,
-                    "senderId": AGENT_ID,
-                    "recipientId": sender_id,
-                    "content": "",
-                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-                    "type": "Text",
-                    "chunk": chunk_text,
-                    "complete": False
-                }
-                continue
+                    # Yield the function call as a separate chunk
+                    yield emit(chunk_text)
+                    continue
                 
-            # Accumulate the response
-            accumulated_response += chunk_text
-            
-            # Yield the chunk
-            yield {
-                "messageId": message_id,
-                "conversationId": conversation_id,
-                "senderId": AGENT_ID,
-                "recipientId": sender_id,
-                "content": "",
-                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-                "type": "Text",
-                "chunk": chunk_text,
-                "complete": False
-            }
-            
-            # Small delay to ensure smooth streaming
-            time.sleep(0.01)
+                # Accumulate the response
+                accumulated_response += chunk_text
             
+                # Yield the chunk
+                yield emit(chunk_text)
+
+            cache_response(cache_key, accumulated_response)
+
+        store_chat_history(conversation_id, history, turns, accumulated_response)
+
         # Final chunk with the complete response
-        yield {
-            "messageId": message_id,
-            "conversationId": conversation_id,
-            "senderId": AGENT_ID,
-            "recipientId": sender_id,
-            "content": accumulated_response,
-            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-            "type": "Text",
-            "chunk": None,
-            "complete": True,
-            "response": accumulated_response
-        }
+        yield emit(None, complete=True, content=accumulated_response, response=accumulated_response)
     except Exception as e:
-        print(f"Error in streaming process: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in streaming process")
         
         # Yield an error response
-        yield {
-            "messageId": message_id,
-            "conversationId": conversation_id,
-            "senderId": AGENT_ID,
-            "recipientId": sender_id,
-            "content": f"Error: {str(e)}",
-            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-            "type": "Text",
-            "chunk": f"Error: {str(e)}",
-            "complete": True
-        }
+        yield emit(f"Error: {str(e)}", complete=True, content=f"Error: {str(e)}")
 
 
 async def stream_sk_response(chat_service, chat_history, settings):
@@ -294,62 +445,92 @@ async def stream_sk_response(chat_service, chat_history, settings):
         yield chunk
 
 
-def process_message(message):
-    """Process a message synchronously."""
+async def first_token_heartbeats(stream):
+    """Pass a stream through, yielding SSE_HEARTBEAT until its first item arrives.
+
+    One pump task iterates the stream from start to end and the stream is closed
+    however this generator finishes, so a client disconnect also ends the model call.
+    """
+    queue = asyncio.Queue(maxsize=64)
+
+    async def pump():
+        # No end marker on cancellation: nobody is left to read it, and the queue may be full
+        try:
+            async for item in stream:
+                await queue.put(item)
+        except Exception:
+            await queue.put(STREAM_DONE)
+            raise
+        await queue.put(STREAM_DONE)
+
+    pump_task = asyncio.create_task(pump())
+    first = True
+    try:
+        while True:
+            if first:
+                try:
+                    async with asyncio.timeout(HEARTBEAT_INTERVAL):
+                        item = await queue.get()
+                except TimeoutError:
+                    yield SSE_HEARTBEAT
+                    continue
+                first = False
+            else:
+                item = await queue.get()
+            if item is STREAM_DONE:
+                break
+            yield item
+        # Re-raise anything the stream failed with
+        pump_task.result()
+    finally:
+        if not pump_task.done():
+            pump_task.cancel()
+            await asyncio.gather(pump_task, return_exceptions=True)
+        await stream.aclose()
+
+
+async def process_message(message):
+    """Process a message and return the complete response."""
     
     content = message.get("content", "")
-    
-    # Create a chat history for the semantic kernel
-    history = ChatHistory()
-    history.add_system_message(SYSTEM_MESSAGE)
-    
-    # If chat history is provided, add it to the history
-    chat_history = message.get("chatHistory", [])
-    for msg in chat_history:
-        if msg.get("role") == "user":
-            history.add_user_message(msg.get("content", ""))
-        elif msg.get("role") == "assistant":
-            history.add_assistant_message(msg.get("content", ""))
+    conversation_id = message.get("conversationId", "")
     
     try:
-        # Add the user message
-        history.add_user_message(content)
+        # Get the chat history for the semantic kernel, including the user message
+        history, turns = get_chat_history(conversation_id, message.get("chatHistory", []), content)
         
-        # Setup execution settings with explicit function calling enabled
-        settings = OpenAIChatPromptExecutionSettings(
-            service_id="chat-gpt",
-            function_choice_behavior=FunctionChoiceBehavior.Auto(),
-            max_tokens=2000
-        )
+        # Copy the prebuilt settings; SK assigns per-call fields on them
+        settings = EXECUTION_SETTINGS.model_copy(update={"max_tokens": max_output_tokens(content)})
         
-        # Create an asyncio event loop
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # Get response from the chat service
-        result = loop.run_until_complete(
-            chat_service.get_chat_message_content(
+        cache_key = response_cache_key(turns)
+        response_content = get_cached_response(cache_key)
+        if response_content is None:
+            # Get response from the chat service
+            result = await chat_service.get_chat_message_content(
                 chat_history=history,
                 settings=settings,
                 kernel=kernel
             )
-        )
+            
+            response_content = str(result)
+            cache_response(cache_key, response_content)
         
-        return str(result)
+        store_chat_history(conversation_id, history, turns, response_content)
+        return response_content
     
     except Exception as e:
-        print(f"Error processing message: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error processing message")
         return f"I encountered an error while processing your math query: {str(e)}"
 
 
 if __name__ == "__main__":
     print("Starting Math Agent with ID:", AGENT_ID)
-    import logging
-    log = logging.getLogger('werkzeug')
-    log.setLevel(logging.ERROR)
 
-    app.run(host="0.0.0.0", port=5004)
+    # Multiple workers need an import string so each process loads its own app
+    if WORKERS > 1:
+        uvicorn.run("math_agent:app", app_dir=os.path.dirname(os.path.abspath(__file__)),
+                    host="0.0.0.0", port=5004, workers=WORKERS, log_level="error")
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=5004, log_level="error")
 
 
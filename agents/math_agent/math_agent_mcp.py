@@ -1,315 +1,378 @@
 #!/usr/bin/env python3
 
 import asyncio
-import json
+import atexit
 import time
 import uuid
 import os
 import logging
-import subprocess
-from flask import Flask, request, jsonify, Response, stream_with_context
+import queue
+import re
+from collections import OrderedDict
+from contextlib import AsyncExitStack, asynccontextmanager
+from functools import partial
+from logging.handlers import QueueHandler, QueueListener
+import orjson
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
-app = Flask(__name__)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the MCP session pool on the serving loop, then close it and its math servers."""
+    success = await init_mcp_client()
+    if not success:
+        logger.warning("Math Agent starting without MCP connection")
+    yield
+    await mcp_pool.close()
+
+app = FastAPI(title="Math Agent (MCP)", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Load environment variables from .env file
 load_dotenv()
 
 AGENT_ID = "math-agent"
+MCP_CALL_TIMEOUT = 30  # Seconds to wait on the math server for one query
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "4"))  # Math server subprocesses to run
 
-# MCP client session
-mcp_session = None
+# Log through a queue so request handlers never block on stdout; the
+# listener thread performs the actual writes
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+log_queue = queue.Queue(-1)
+log_listener = QueueListener(log_queue, log_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
 
-async def init_mcp_client():
-    """Initialize the MCP client connection to the math server."""
-    global mcp_session
+logger = logging.getLogger(AGENT_ID)
+logger.setLevel(logging.INFO)
+logger.addHandler(QueueHandler(log_queue))
+logger.propagate = False
+
+# Environment handed to the math server subprocess, snapshotted once
+MCP_SERVER_ENV = dict(os.environ)
+
+# Integers and decimals, compiled once for extract_numbers
+NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?')
+
+# Last formatted timestamp, reused until the second changes
+_last_timestamp = (0, "")
+
+def utc_timestamp():
+    """Return the current UTC time as an ISO 8601 string, formatting at most once per second."""
+    global _last_timestamp
+    now = int(time.time())
+    if _last_timestamp[0] != now:
+        _last_timestamp = (now, time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)))
+    return _last_timestamp[1]
+
+class MCPSessionPool:
+    """A fixed set of MCP sessions, each backed by its own math server subprocess."""
+    
+    def __init__(self):
+        self.sessions = asyncio.Queue()
+        self.exit_stack = AsyncExitStack()
+        self.size = 0
+        self.tool_names = set()
+    
+    async def open_session(self, server_params):
+        """Start one math server subprocess and add its session to the pool."""
+        read_stream, write_stream = await self.exit_stack.enter_async_context(stdio_client(server_params))
+        session = await self.exit_stack.enter_async_context(ClientSession(read_stream, write_stream))
+        await session.initialize()
+        
+        # Every subprocess runs the same server, so list its tools only once
+        if not self.tool_names:
+            self.tool_names = {tool.name for tool in (await session.list_tools()).tools}
+        self.sessions.put_nowait(session)
+        self.size += 1
     
-    # Start the MCP math server as a subprocess
+    @asynccontextmanager
+    async def acquire(self):
+        """Check a session out of the pool, returning it when the block exits."""
+        session = await self.sessions.get()
+        try:
+            yield session
+        finally:
+            self.sessions.put_nowait(session)
+    
+    async def close(self):
+        """Close every session and stop the math server subprocesses."""
+        await self.exit_stack.aclose()
+        self.size = 0
+
+# Pool of MCP sessions shared by all requests
+mcp_pool = MCPSessionPool()
+
+# Answers keyed on the normalized query, least recently used evicted first
+MAX_CACHED_ANSWERS = 1024
+answer_cache = OrderedDict()
+
+class ToolCallFailed(Exception):
+    """An MCP call failed for a reason other than the input (closed session, server restart).
+
+    The message is the reply for the user; unlike domain errors it is never cached.
+    """
+
+async def init_mcp_client():
+    """Initialize the MCP client connections to the math server."""
+    # Start the MCP math server as a subprocess per pooled session
     server_params = StdioServerParameters(
         command="python",
         args=["../../mcp_server/server.py"],
-        env=os.environ.copy()
+        env=MCP_SERVER_ENV
     )
     
     try:
-        mcp_session = await stdio_client(server_params)
-        await mcp_session.__aenter__()
-        
-        # Initialize the session
-        await mcp_session.initialize()
-        
-        print("MCP Math Server connected successfully")
-        return True
-    except Exception as e:
-        print(f"Failed to connect to MCP Math Server: {e}")
-        return False
+        for _ in range(MCP_POOL_SIZE):
+            await mcp_pool.open_session(server_params)
+    except Exception:
+        logger.exception("Failed to connect to MCP Math Server")
+    
+    if mcp_pool.size:
+        logger.info("MCP Math Server connected successfully (%d sessions)", mcp_pool.size)
+    return mcp_pool.size > 0
 
-@app.route('/health', methods=['GET'])
-def health_check():
+async def call_tool(name, arguments):
+    """Call an MCP tool on whichever pooled session is free."""
+    async with mcp_pool.acquire() as session:
+        return await session.call_tool(name, arguments)
+
+@app.get('/health')
+async def health_check():
     """Health check endpoint"""
-    return jsonify({
+    return {
         "status": "healthy",
         "agent_id": AGENT_ID,
-        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-        "mcp_connected": mcp_session is not None
-    }), 200
+        "timestamp": utc_timestamp(),
+        "mcp_connected": mcp_pool.size > 0
+    }
 
-@app.route('/api/message', methods=['POST'])
-def receive_message():
+@app.post('/api/message')
+async def receive_message(request: Request):
     """Endpoint to receive messages from the runtime or external calls."""
     
-    message = request.json
+    try:
+        message = await request.json()
+    except ValueError:
+        message = None
     if not message:
-        return jsonify({"error": "No message provided"}), 400
+        return ORJSONResponse({"error": "No message provided"}, status_code=400)
 
     # Check if streaming is requested
     stream = message.get("stream", False)
 
     if stream:
-        return Response(
-            stream_with_context(process_message_stream(message)),
-            content_type='text/event-stream'
+        return StreamingResponse(
+            sse_stream(process_message_stream(message)),
+            media_type='text/event-stream',
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+                "X-Accel-Buffering": "no",
+            }
         )
     else:
-        # Process synchronously
+        # Process on the server's event loop
         try:
-            response_content = process_message(message)
+            response_content = await process_message(message)
             response = {
                 "messageId": str(uuid.uuid4()),
                 "conversationId": message.get("conversationId", ""),
                 "senderId": AGENT_ID,
                 "recipientId": message.get("senderId", ""),
                 "content": response_content,
-                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "timestamp": utc_timestamp(),
                 "type": "Text"
             }
-            return jsonify(response), 200
+            return ORJSONResponse(response, status_code=200)
         except Exception as e:
-            print(f"Error processing message: {e}")
-            return jsonify({"error": str(e)}), 500
+            logger.exception("Error processing message")
+            return ORJSONResponse({"error": str(e)}, status_code=500)
 
-def stream_with_context_wrapper(generator):
+async def sse_stream(generator):
     """Helper that yields SSE lines and ends with [DONE]."""
     try:
-        for chunk in generator:
-            yield f"data: {json.dumps(chunk)}\n\n"
-        yield "data: [DONE]\n\n"
+        async for chunk in generator:
+            yield b"data: " + orjson.dumps(chunk) + b"\n\n"
+            # Hand control back to the loop so the frame is written out
+            # before the generator starts on the next chunk
+            await asyncio.sleep(0)
+        yield b"data: [DONE]\n\n"
     except Exception as e:
-        print(f"Error in streaming: {e}")
-        yield f"data: {json.dumps({'error': str(e)})}\n\n"
-        yield "data: [DONE]\n\n"
+        logger.exception("Error in streaming")
+        yield b"data: " + orjson.dumps({"error": str(e)}) + b"\n\n"
+        yield b"data: [DONE]\n\n"
 
-def process_message_stream(message):
+async def process_message_stream(message):
     """Process a message from the client and stream the response."""
     content = message.get("content", "")
     conversation_id = message.get("conversationId", "")
     sender_id = message.get("senderId", "")
     message_id = str(uuid.uuid4())
 
-    # Yield an initial chunk to indicate the calculation has started
-    yield {
+    # Fields shared by every chunk of this response, built once per request
+    base = {
         "messageId": message_id,
         "conversationId": conversation_id,
         "senderId": AGENT_ID,
         "recipientId": sender_id,
-        "content": "",
-        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
         "type": "Text",
-        "chunk": "ƒ(x) calling math-agent...",
-        "complete": False
     }
+
+    def emit(chunk_text, complete=False, content=""):
+        return {**base, "content": content, "timestamp": utc_timestamp(), "chunk": chunk_text, "complete": complete}
+
+    # Yield an initial chunk to indicate the calculation has started
+    yield emit("ƒ(x) calling math-agent...")
     
     try:
-        # Process the math query using MCP
-        response = process_message(message)
+        # Announce the MCP tool before calling it so the client sees which
+        # operation is running while the math server works
+        query = content.strip().lower()
+        handler, tool_name = match_operation(query)
+        if tool_name and mcp_pool.size:
+            yield emit(f"ƒ(x) calling {tool_name}...\n")
         
-        # Stream the response word by word for better UX
-        words = response.split()
-        accumulated_response = ""
+        # Process the math query using MCP and send the result as soon as it
+        # arrives, keeping its original line breaks
+        response = await solve_math_problem(query, handler)
+        yield emit(response)
         
-        for word in words:
-            accumulated_response += word + " "
-            
-            yield {
-                "messageId": message_id,
-                "conversationId": conversation_id,
-                "senderId": AGENT_ID,
-                "recipientId": sender_id,
-                "content": "",
-                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-                "type": "Text",
-                "chunk": word + " ",
-                "complete": False
-            }
-            
-            # Small delay for streaming effect
-            time.sleep(0.05)
-            
         # Final chunk with the complete response
-        yield {
-            "messageId": message_id,
-            "conversationId": conversation_id,
-            "senderId": AGENT_ID,
-            "recipientId": sender_id,
-            "content": accumulated_response.strip(),
-            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-            "type": "Text",
-            "chunk": None,
-            "complete": True,
-            "response": accumulated_response.strip()
-        }
+        final_chunk = emit(None, complete=True, content=response)
+        final_chunk["response"] = response
+        yield final_chunk
     except Exception as e:
-        print(f"Error in streaming process: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in streaming process")
         
         # Yield an error response
-        yield {
-            "messageId": message_id,
-            "conversationId": conversation_id,
-            "senderId": AGENT_ID,
-            "recipientId": sender_id,
-            "content": f"Error: {str(e)}",
-            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-            "type": "Text",
-            "chunk": f"Error: {str(e)}",
-            "complete": True
-        }
-
-def process_message(message):
+        yield emit(f"Error: {str(e)}", complete=True, content=f"Error: {str(e)}")
+
+async def process_message(message):
     """Process a math query using the MCP server."""
-    content = message.get("content", "").lower()
+    # Normalize once; every handler works on the same lower-cased query
+    query = message.get("content", "").strip().lower()
+    handler, _ = match_operation(query)
+    return await solve_math_problem(query, handler)
+
+async def solve_math_problem(query, handler):
+    """Solve a normalized math query with its handler and the MCP tools."""
+    # Every supported operation is deterministic, so repeats skip MCP
+    cached = answer_cache.get(query)
+    if cached is not None:
+        answer_cache.move_to_end(query)
+        return cached
     
-    if not mcp_session:
+    if not mcp_pool.size:
         return "Math Agent Error: MCP server not connected. Please check the math server status."
     
     try:
-        # Create event loop for async operations
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # Parse the math query and determine which operations to perform
-        result = loop.run_until_complete(solve_math_problem(content))
+        result = await asyncio.wait_for(handler(query), timeout=MCP_CALL_TIMEOUT)
         
+        answer_cache[query] = result
+        if len(answer_cache) > MAX_CACHED_ANSWERS:
+            answer_cache.popitem(last=False)
         return result
+    except ToolCallFailed as e:
+        logger.warning("MCP tool call failed: %s", e.__cause__)
+        return str(e)
+    except asyncio.TimeoutError:
+        logger.warning("Math query timed out after %ss", MCP_CALL_TIMEOUT)
+        return "Math Agent Error: the math server did not respond in time."
     except Exception as e:
-        print(f"Error processing math query: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error processing math query")
         return f"Math Agent Error: {str(e)}"
 
-async def solve_math_problem(query):
-    """Solve a math problem by breaking it down and using MCP tools."""
-    query = query.lower().strip()
-    
-    # Simple parsing for basic operations
-    if "add" in query or "plus" in query or " + " in query:
-        return await handle_addition(query)
-    elif "subtract" in query or "minus" in query or " - " in query:
-        return await handle_subtraction(query)
-    elif "multiply" in query or "times" in query or " * " in query or " × " in query:
-        return await handle_multiplication(query)
-    elif "divide" in query or "divided by" in query or " / " in query or " ÷ " in query:
-        return await handle_division(query)
-    elif "square root" in query or "sqrt" in query:
-        return await handle_square_root(query)
-    elif "power" in query or "raised to" in query or " ^ " in query or "**" in query:
-        return await handle_power(query)
-    elif "log" in query or "logarithm" in query:
-        return await handle_logarithm(query)
-    elif "modulo" in query or "mod " in query or " % " in query:
-        return await handle_modulo(query)
-    else:
+def match_operation(query):
+    """Return the handler and MCP tool name for a lower-cased query."""
+    # One scan collects every keyword; the earliest operation in
+    # OPERATIONS wins, matching the original if/elif precedence
+    rank = min((OPERATION_RANKS[match.group()] for match in OPERATION_RE.finditer(query)), default=None)
+    if rank is None:
         # Try to evaluate as a complex expression
-        return await handle_complex_expression(query)
-
-async def handle_addition(query):
-    """Handle addition operations."""
-    # Extract numbers from the query
-    numbers = extract_numbers(query)
-    if len(numbers) >= 2:
-        result = await mcp_session.call_tool("add", {"a": numbers[0], "b": numbers[1]})
-        return f"The result of {numbers[0]} + {numbers[1]} = **{result.content[0].text}**"
-    return "Please provide two numbers to add."
+        return handle_complex_expression, None
+    _, handler, tool_name = OPERATIONS[rank]
+    if mcp_pool.tool_names and tool_name not in mcp_pool.tool_names:
+        # The connected server does not provide this operation
+        return handle_complex_expression, None
+    return handler, tool_name
 
-async def handle_subtraction(query):
-    """Handle subtraction operations."""
-    numbers = extract_numbers(query)
-    if len(numbers) >= 2:
-        result = await mcp_session.call_tool("subtract", {"a": numbers[0], "b": numbers[1]})
-        return f"The result of {numbers[0]} - {numbers[1]} = **{result.content[0].text}**"
-    return "Please provide two numbers to subtract."
-
-async def handle_multiplication(query):
-    """Handle multiplication operations."""
-    numbers = extract_numbers(query)
-    if len(numbers) >= 2:
-        result = await mcp_session.call_tool("multiply", {"a": numbers[0], "b": numbers[1]})
-        return f"The result of {numbers[0]} × {numbers[1]} = **{result.content[0].text}**"
-    return "Please provide two numbers to multiply."
+# Two-operand MCP tools: argument names, how the expression is shown, the
+# reply when fewer than two numbers are given, and the prefix for tool errors
+# (None lets the error propagate). Only the input's own errors are answered
+# directly; any other failure is raised as ToolCallFailed so it isn't cached
+BINARY_OPERATIONS = {
+    "add": (("a", "b"), "{0} + {1}", "Please provide two numbers to add.", None),
+    "subtract": (("a", "b"), "{0} - {1}", "Please provide two numbers to subtract.", None),
+    "multiply": (("a", "b"), "{0} × {1}", "Please provide two numbers to multiply.", None),
+    "divide": (("a", "b"), "{0} ÷ {1}", "Please provide two numbers to divide.", "Division error"),
+    "power": (("base", "exponent"), "{0} raised to the power of {1}", "Please provide a base and exponent for the power operation.", None),
+}
 
-async def handle_division(query):
-    """Handle division operations."""
+async def handle_binary_operation(tool_name, query):
+    """Handle a two-operand operation through its MCP tool."""
+    argument_names, expression, missing_operands, error_label = BINARY_OPERATIONS[tool_name]
     numbers = extract_numbers(query)
-    if len(numbers) >= 2:
-        try:
-            result = await mcp_session.call_tool("divide", {"a": numbers[0], "b": numbers[1]})
-            return f"The result of {numbers[0]} ÷ {numbers[1]} = **{result.content[0].text}**"
-        except Exception as e:
-            if "divide by zero" in str(e).lower():
-                return "Error: Cannot divide by zero!"
-            return f"Division error: {str(e)}"
-    return "Please provide two numbers to divide."
+    if len(numbers) < 2:
+        return missing_operands
+    
+    operands = numbers[:2]
+    try:
+        result = await call_tool(tool_name, dict(zip(argument_names, operands)))
+    except Exception as e:
+        if error_label is None:
+            raise
+        if "divide by zero" in str(e).lower():
+            return "Error: Cannot divide by zero!"
+        raise ToolCallFailed(f"{error_label}: {str(e)}") from e
+    return f"The result of {expression.format(*operands)} = **{result.content[0].text}**"
 
 async def handle_square_root(query):
     """Handle square root operations."""
     numbers = extract_numbers(query)
     if len(numbers) >= 1:
         try:
-            result = await mcp_session.call_tool("square_root", {"x": numbers[0]})
+            result = await call_tool("square_root", {"x": numbers[0]})
             return f"The square root of {numbers[0]} = **{result.content[0].text}**"
         except Exception as e:
             if "negative" in str(e).lower():
                 return "Error: Cannot calculate square root of a negative number!"
-            return f"Square root error: {str(e)}"
+            raise ToolCallFailed(f"Square root error: {str(e)}") from e
     return "Please provide a number to find the square root of."
 
-async def handle_power(query):
-    """Handle power/exponentiation operations."""
-    numbers = extract_numbers(query)
-    if len(numbers) >= 2:
-        result = await mcp_session.call_tool("power", {"base": numbers[0], "exponent": numbers[1]})
-        return f"The result of {numbers[0]} raised to the power of {numbers[1]} = **{result.content[0].text}**"
-    return "Please provide a base and exponent for the power operation."
-
 async def handle_logarithm(query):
     """Handle logarithm operations."""
     numbers = extract_numbers(query)
     if len(numbers) >= 1:
         try:
             if len(numbers) >= 2:
-                result = await mcp_session.call_tool("log", {"x": numbers[0], "base": numbers[1]})
+                result = await call_tool("log", {"x": numbers[0], "base": numbers[1]})
                 return f"The logarithm of {numbers[0]} with base {numbers[1]} = **{result.content[0].text}**"
             else:
-                result = await mcp_session.call_tool("log", {"x": numbers[0]})
+                result = await call_tool("log", {"x": numbers[0]})
                 return f"The natural logarithm of {numbers[0]} = **{result.content[0].text}**"
         except Exception as e:
-            return f"Logarithm error: {str(e)}"
+            raise ToolCallFailed(f"Logarithm error: {str(e)}") from e
     return "Please provide a number for the logarithm operation."
 
 async def handle_modulo(query):
     """Handle modulo operations."""
-    numbers = extract_numbers(query)
-    if len(numbers) >= 2:
+    # Parse integers straight from the text; decimals are rejected rather
+    # than silently truncated
+    operands = NUMBER_RE.findall(query)[:2]
+    if len(operands) == 2 and not any("." in operand for operand in operands):
+        a, b = int(operands[0]), int(operands[1])
         try:
-            result = await mcp_session.call_tool("modulo", {"a": int(numbers[0]), "b": int(numbers[1])})
-            return f"The result of {int(numbers[0])} mod {int(numbers[1])} = **{result.content[0].text}**"
+            result = await call_tool("modulo", {"a": a, "b": b})
+            return f"The result of {a} mod {b} = **{result.content[0].text}**"
         except Exception as e:
             if "modulo by zero" in str(e).lower():
                 return "Error: Cannot modulo by zero!"
-            return f"Modulo error: {str(e)}"
+            raise ToolCallFailed(f"Modulo error: {str(e)}") from e
     return "Please provide two integers for the modulo operation."
 
 async def handle_complex_expression(query):
@@ -331,30 +394,31 @@ async def handle_complex_expression(query):
 
 Please rephrase your question using one of these formats!"""
 
+# Keyword triggers for each operation, in precedence order
+OPERATIONS = (
+    (("add", "plus", " + "), partial(handle_binary_operation, "add"), "add"),
+    (("subtract", "minus", " - "), partial(handle_binary_operation, "subtract"), "subtract"),
+    (("multiply", "times", " * ", " × "), partial(handle_binary_operation, "multiply"), "multiply"),
+    (("divide", "divided by", " / ", " ÷ "), partial(handle_binary_operation, "divide"), "divide"),
+    (("square root", "sqrt"), handle_square_root, "square_root"),
+    (("power", "raised to", " ^ ", "**"), partial(handle_binary_operation, "power"), "power"),
+    (("log", "logarithm"), handle_logarithm, "log"),
+    (("modulo", "mod ", " % "), handle_modulo, "modulo"),
+)
+OPERATION_RANKS = {
+    keyword: rank
+    for rank, (keywords, _, _) in enumerate(OPERATIONS)
+    for keyword in keywords
+}
+# Longest keywords first so an alternation never stops at a shorter prefix
+OPERATION_RE = re.compile("|".join(re.escape(keyword) for keyword in sorted(OPERATION_RANKS, key=len, reverse=True)))
+
 def extract_numbers(text):
     """Extract numbers from text."""
-    import re
     # Find all numbers (including decimals) in the text
-    numbers = re.findall(r'-?\d+\.?\d*', text)
-    return [float(num) for num in numbers if num]
-
-async def startup():
-    """Initialize the MCP connection on startup."""
-    success = await init_mcp_client()
-    if not success:
-        print("Warning: Math Agent starting without MCP connection")
+    return [float(num) for num in NUMBER_RE.findall(text)]
 
 if __name__ == "__main__":
     print("Starting Math Agent (MCP-powered) with ID:", AGENT_ID)
     
-    # Initialize MCP connection
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(startup())
-    
-    # Disable Flask access logs
-    import logging
-    log = logging.getLogger('werkzeug')
-    log.setLevel(logging.ERROR)
-
-    app.run(host="0.0.0.0", port=5004)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=5004, log_level="error")
@@ -1,8 +1,11 @@
+import logging
 import math
 from typing import Annotated
 
 from semantic_kernel.functions.kernel_function_decorator import kernel_function
 
+logger = logging.getLogger(__name__)
+
 
 class MathPlugin:
     """Description: MathPlugin provides a set of functions to make Math calculations.
@@ -26,11 +29,7 @@ class MathPlugin:
         amount: Annotated[float, "the second number to add"],
     ) -> Annotated[float, "the sum of the two numbers"]:
         """Returns the addition result of the values provided."""
-        print(f"ƒ(x) calling add({input}, {amount})")
-        if isinstance(input, str):
-            input = float(input)
-        if isinstance(amount, str):
-            amount = float(amount)
+        logger.debug("ƒ(x) calling add(%s, %s)", input, amount)
         return input + amount
 
     @kernel_function(name="Subtract", description="Subtracts the second number from the first.")
@@ -40,11 +39,7 @@ class MathPlugin:
         amount: Annotated[float, "the number to subtract"],
     ) -> Annotated[float, "the difference between the two numbers"]:
         """Returns the difference of numbers provided."""
-        print(f"ƒ(x) calling subtract({input}, {amount})")
-        if isinstance(input, str):
-            input = float(input)
-        if isinstance(amount, str):
-            amount = float(amount)
+        logger.debug("ƒ(x) calling subtract(%s, %s)", input, amount)
         return input - amount
 
     @kernel_function(name="Multiply", description="Multiplies two numbers together.")
@@ -54,11 +49,7 @@ class MathPlugin:
         amount: Annotated[float, "the second number to multiply"],
     ) -> Annotated[float, "the product of the two numbers"]:
         """Returns the product of the values provided."""
-        print(f"ƒ(x) calling multiply({input}, {amount})")
-        if isinstance(input, str):
-            input = float(input)
-        if isinstance(amount, str):
-            amount = float(amount)
+        logger.debug("ƒ(x) calling multiply(%s, %s)", input, amount)
         return input * amount
 
     @kernel_function(name="Divide", description="Divides the first number by the second.")
@@ -68,11 +59,7 @@ class MathPlugin:
         amount: Annotated[float, "the number to divide by"],
     ) -> Annotated[float, "the quotient of the division"]:
         """Returns the quotient of the division."""
-        print(f"ƒ(x) calling divide({input}, {amount})")
-        if isinstance(input, str):
-            input = float(input)
-        if isinstance(amount, str):
-            amount = float(amount)
+        logger.debug("ƒ(x) calling divide(%s, %s)", input, amount)
         
         if amount == 0:
             raise ValueError("Cannot divide by zero.")
@@ -85,14 +72,11 @@ class MathPlugin:
         input: Annotated[float, "the number to find the square root of"],
     ) -> Annotated[float, "the square root of the number"]:
         """Returns the square root of the value provided."""
-        print(f"ƒ(x) calling square_root({input})")
-        if isinstance(input, str):
-            input = float(input)
+        logger.debug("ƒ(x) calling square_root(%s)", input)
         
         if input < 0:
             raise ValueError("Cannot calculate square root of a negative number.")
         
-        import math
         return math.sqrt(input)
 
     @kernel_function(name="Power", description="Raises a number to the power of another.")
@@ -102,11 +86,7 @@ class MathPlugin:
         exponent: Annotated[float, "the exponent to raise the base to"],
     ) -> Annotated[float, "the result of the exponentiation"]:
         """Returns the base raised to the power of the exponent."""
-        print(f"ƒ(x) calling power({input}, {exponent})")
-        if isinstance(input, str):
-            input = float(input)
-        if isinstance(exponent, str):
-            exponent = float(exponent)
+        logger.debug("ƒ(x) calling power(%s, %s)", input, exponent)
         
         return input ** exponent 
 
@@ -117,11 +97,7 @@ class MathPlugin:
         base: Annotated[float, "the base of the logarithm (optional, defaults to e for natural log)"] = math.e,
     ) -> Annotated[float, "the logarithm of the input"]:
         """Returns the logarithm of the input with the specified base (defaults to natural log)."""
-        print(f"ƒ(x) calling log({input}, base={base})")
-        if isinstance(input, str):
-            input = float(input)
-        if isinstance(base, str):
-            base = float(base)
+        logger.debug("ƒ(x) calling log(%s, base=%s)", input, base)
         
         if input <= 0:
             raise ValueError("Cannot calculate logarithm of a non-positive number.")
@@ -140,7 +116,7 @@ class MathPlugin:
         amount: Annotated[int, "the divisor"],
     ) -> Annotated[int, "the remainder of the division"]:
         """Returns the remainder of division."""
-        print(f"ƒ(x) calling modulo({input}, {amount})")
+        logger.debug("ƒ(x) calling modulo(%s, %s)", input, amount)
         if amount == 0:
             raise ValueError("Cannot modulo by zero.")
         return input % amount
@@ -151,15 +127,18 @@ class MathPlugin:
         input: Annotated[int, "the number to find the modular inverse of"],
         modulus: Annotated[int, "the modulus"],
     ) -> Annotated[int, "the modular inverse of the number modulo the given modulus"]:
-        """Returns the modular inverse of input modulo modulus using brute-force search."""
-        print(f"ƒ(x) calling modular_inverse({input}, {modulus})")
+        """Returns the modular inverse of input modulo modulus using the extended Euclidean algorithm."""
+        logger.debug("ƒ(x) calling modular_inverse(%s, %s)", input, modulus)
+
+        # pow accepts these moduli (pow(0, -1, 1) == 0), but no inverse exists for them
+        if modulus <= 1:
+            raise ValueError(f"No modular inverse exists for {input} mod {modulus}.")
 
         # Ensure input is within modulo range
         input = input % modulus
         
-        # Brute force search for modular inverse
-        for x in range(1, modulus):
-            if (input * x) % modulus == 1:
-                return x
-
-        raise ValueError(f"No modular inverse exists for {input} mod {modulus}.")
+        # pow with exponent -1 runs extended Euclid in C, O(log modulus)
+        try:
+            return pow(input, -1, modulus)
+        except ValueError:
+            raise ValueError(f"No modular inverse exists for {input} mod {modulus}.") from None
@@ -7,6 +7,21 @@ import uvicorn
 # Add the current directory to the path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+# Conversations are held in process memory, so keep a single worker unless
+# the deployment routes each conversation to the same process
+WORKERS = int(os.getenv("API_WORKERS", "1"))
+
 if __name__ == "__main__":
     print("Starting Agent Runtime API on 0.0.0.0:5003")
-    uvicorn.run("api.runtime_api:app", host="0.0.0.0", port=5003, log_level="error") 
\ No newline at end of file
+    uvicorn.run(
+        "api.runtime_api:app",
+        host="0.0.0.0",
+        port=5003,
+        log_level="error",
+        # "auto" selects uvloop and httptools, installed with uvicorn[standard]
+        loop="auto",
+        http="auto",
+        timeout_keep_alive=30,
+        backlog=2048,
+        workers=WORKERS
+    )
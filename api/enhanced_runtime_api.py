@@ -2,23 +2,26 @@
 
 """Enhanced Runtime API with database persistence and session management."""
 
-import asyncio
-import json
 import logging
 import time
 import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Type
 
+import orjson
 import uvicorn
-from fastapi import Depends, FastAPI, HTTPException, Header, Cookie, Response
+from fastapi import Depends, FastAPI, HTTPException, Header, Cookie, Request, Response
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel, Field
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from api.sse import coalesce_frames, sse_event
 from config import get_settings
-from database import get_db, init_db
-from database.session import create_session, get_session
+from database import close_db, get_db, init_db
+from database.session import create_session, delete_expired_sessions, get_session_info
 from runtime.enhanced_agent_runtime import EnhancedAgentRuntime
 
 # Configure logging
@@ -30,10 +33,28 @@ logger = logging.getLogger("enhanced_runtime_api")
 
 settings = get_settings()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize the database and warm the runtime before serving, then release the pools."""
+    await init_db()
+    async with get_db() as db:
+        expired = await delete_expired_sessions(db)
+    if expired:
+        logger.info(f"Removed {expired} expired sessions")
+    runtime = EnhancedAgentRuntime()
+    await runtime.initialize()
+    app.state.runtime = runtime
+    logger.info("Enhanced Runtime API started successfully")
+    yield
+    await runtime.aclose()
+    await close_db()
+
 app = FastAPI(
     title="Enhanced Agent Runtime API",
     description="Agent Runtime API with database persistence and session management",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -46,8 +67,12 @@ app.add_middleware(
 )
 
 # Pydantic models
+# Request models ignore unknown fields rather than validating them
+REQUEST_MODEL_CONFIG = ConfigDict(extra="ignore", populate_by_name=True, str_strip_whitespace=False)
+
 class QueryRequest(BaseModel):
     """Enhanced query request with session support."""
+    model_config = REQUEST_MODEL_CONFIG
     query: str
     conversation_id: Optional[str] = None
     session_token: Optional[str] = None
@@ -57,12 +82,14 @@ class QueryRequest(BaseModel):
 
 class SessionCreateRequest(BaseModel):
     """Session creation request."""
+    model_config = REQUEST_MODEL_CONFIG
     user_id: Optional[str] = None
     expires_in_hours: int = Field(default=24 * 7, ge=1, le=24 * 30)  # 1 hour to 30 days
     extra_data: Optional[Dict[str, Any]] = None
 
 class ConversationRequest(BaseModel):
     """Conversation creation request."""
+    model_config = REQUEST_MODEL_CONFIG
     title: Optional[str] = None
     session_token: Optional[str] = None
     extra_data: Optional[Dict[str, Any]] = None
@@ -84,59 +111,89 @@ class SessionResponse(BaseModel):
     created_at: str
     extra_data: Optional[Dict[str, Any]]
 
-# Singleton runtime instance
-_runtime_instance: Optional[EnhancedAgentRuntime] = None
+def json_body(model: Type[BaseModel]):
+    """Dependency that validates the raw request body in a single pass with model_validate_json."""
+    async def parse(request: Request):
+        try:
+            return model.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(e.errors(include_url=False))
+    return parse
 
-async def get_runtime() -> EnhancedAgentRuntime:
-    """Get or create the Enhanced Agent Runtime instance."""
-    global _runtime_instance
-    if _runtime_instance is None:
-        _runtime_instance = EnhancedAgentRuntime()
-        # Short delay to allow kernel initialization
-        await asyncio.sleep(1)
-    return _runtime_instance
+def body_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """OpenAPI request body for endpoints that parse their body with json_body."""
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": model.model_json_schema()}}}}
 
-async def get_session_from_token(session_token: Optional[str] = Header(None, alias="X-Session-Token")) -> Optional[str]:
-    """Get session from token header."""
-    if not session_token:
-        return None
-    
+# Pre-serialized /api/agents body, keyed on the runtime's agent registry
+AGENTS_CACHE_TTL = 60.0
+_agents_cache: Optional[Tuple[Tuple[int, int], float, bytes]] = None
+
+def agents_payload(runtime: EnhancedAgentRuntime) -> bytes:
+    """Return the /api/agents JSON body, rebuilding it only when the registry changes or the TTL lapses."""
+    global _agents_cache
+    key = (id(runtime.agents), runtime.agents_version)
+    now = time.monotonic()
+    if _agents_cache is not None and _agents_cache[0] == key and _agents_cache[1] > now:
+        return _agents_cache[2]
+
+    result = [
+        {
+            "id": agent.id,
+            "name": agent.name,
+            "description": agent.description,
+            "capabilities": agent.capabilities,
+            "conversation_starters": agent.conversation_starters,
+            "endpoint": agent.endpoint
+        }
+        for agent in runtime.get_all_agents().values()
+    ]
+    payload = orjson.dumps({"agents": result})
+    _agents_cache = (key, now + AGENTS_CACHE_TTL, payload)
+    return payload
+
+async def get_runtime(request: Request) -> EnhancedAgentRuntime:
+    """Get the runtime built during application startup."""
+    return request.app.state.runtime
+
+async def db_session_dep() -> AsyncIterator[AsyncSession]:
+    """Yield one database session shared by everything a request depends on."""
     async with get_db() as db:
-        session = await get_session(db, session_token)
-        return session.id if session else None
+        yield db
+
+async def resolve_session(db: Optional[AsyncSession], session_token: str) -> Tuple[Optional[str], Optional[str]]:
+    """Resolve a session token to (session_id, user_id) through the cached session lookup."""
+    info = await get_session_info(db, session_token)
+    return (info.id, info.user_id) if info else (None, None)
 
-async def get_user_from_session(session_token: Optional[str] = Header(None, alias="X-Session-Token")) -> Optional[str]:
-    """Get user ID from session token."""
+async def get_session_context(
+    session_token: Optional[str] = Header(None, alias="X-Session-Token"),
+    db: AsyncSession = Depends(db_session_dep)
+) -> Tuple[Optional[str], Optional[str]]:
+    """Get (session_id, user_id) from the session token header."""
     if not session_token:
-        return None
-    
-    async with get_db() as db:
-        session = await get_session(db, session_token)
-        return session.user_id if session else None
+        return None, None
+    return await resolve_session(db, session_token)
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize database and runtime on startup."""
-    await init_db()
-    logger.info("Enhanced Runtime API started successfully")
+# The root listing never changes, so it is serialized once at import
+ROOT_PAYLOAD = orjson.dumps({
+    "name": "Enhanced Agent Runtime API",
+    "version": "2.0.0",
+    "description": "Agent Runtime API with database persistence and session management",
+    "endpoints": [
+        {"path": "/api/query", "method": "POST", "description": "Process a user query with persistence"},
+        {"path": "/api/sessions", "method": "POST", "description": "Create a new session"},
+        {"path": "/api/conversations", "method": "POST", "description": "Create a new conversation"},
+        {"path": "/api/conversations/{conversation_id}", "method": "GET", "description": "Get conversation history"},
+        {"path": "/api/conversations", "method": "GET", "description": "List user conversations"},
+        {"path": "/api/agents", "method": "GET", "description": "List available agents"},
+        {"path": "/health", "method": "GET", "description": "Health check"}
+    ]
+})
 
 @app.get("/")
 async def root():
     """Root endpoint."""
-    return {
-        "name": "Enhanced Agent Runtime API",
-        "version": "2.0.0",
-        "description": "Agent Runtime API with database persistence and session management",
-        "endpoints": [
-            {"path": "/api/query", "method": "POST", "description": "Process a user query with persistence"},
-            {"path": "/api/sessions", "method": "POST", "description": "Create a new session"},
-            {"path": "/api/conversations", "method": "POST", "description": "Create a new conversation"},
-            {"path": "/api/conversations/{conversation_id}", "method": "GET", "description": "Get conversation history"},
-            {"path": "/api/conversations", "method": "GET", "description": "List user conversations"},
-            {"path": "/api/agents", "method": "GET", "description": "List available agents"},
-            {"path": "/health", "method": "GET", "description": "Health check"}
-        ]
-    }
+    return Response(content=ROOT_PAYLOAD, media_type="application/json")
 
 @app.get("/health")
 async def health_check():
@@ -157,24 +214,24 @@ async def health_check():
         raise HTTPException(status_code=503, detail=f"Service unhealthy: {str(e)}")
 
 @app.post("/api/sessions", response_model=SessionResponse)
-async def create_session_endpoint(request: SessionCreateRequest):
+async def create_session_endpoint(request: SessionCreateRequest, db: AsyncSession = Depends(db_session_dep)):
     """Create a new session."""
     try:
-        async with get_db() as db:
-            session = await create_session(
-                db,
-                user_id=request.user_id,
-                expires_in_hours=request.expires_in_hours,
-                extra_data=request.extra_data
-            )
-            
-            return SessionResponse(
-                id=session.id,
-                session_token=session.session_token,
-                expires_at=session.expires_at.isoformat() if session.expires_at else None,
-                created_at=session.created_at.isoformat(),
-                extra_data=session.extra_data
-            )
+        session = await create_session(
+            db,
+            user_id=request.user_id,
+            expires_in_hours=request.expires_in_hours,
+            extra_data=request.extra_data
+        )
+        
+        # model_construct skips validation: the values come from typed ORM columns
+        return SessionResponse.model_construct(
+            id=session.id,
+            session_token=session.session_token,
+            expires_at=session.expires_at.isoformat() if session.expires_at else None,
+            created_at=session.created_at.isoformat(),
+            extra_data=session.extra_data
+        )
     except Exception as e:
         logger.exception(f"Error creating session: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -182,54 +239,55 @@ async def create_session_endpoint(request: SessionCreateRequest):
 @app.post("/api/conversations", response_model=ConversationResponse)
 async def create_conversation_endpoint(
     request: ConversationRequest,
-    session_id: Optional[str] = Depends(get_session_from_token),
-    user_id: Optional[str] = Depends(get_user_from_session)
+    session_context: Tuple[Optional[str], Optional[str]] = Depends(get_session_context),
+    db: AsyncSession = Depends(db_session_dep)
 ):
     """Create a new conversation."""
+    session_id, user_id = session_context
     try:
-        from database.session import create_conversation, get_or_create_anonymous_user
+        from database.session import create_conversation, get_anonymous_user_id
+    
+        # Get or create user
+        if not user_id:
+            user_id = await get_anonymous_user_id(db)
         
-        async with get_db() as db:
-            # Get or create user
-            if not user_id:
-                user = await get_or_create_anonymous_user(db)
-                user_id = user.id
-            
-            conversation = await create_conversation(
-                db,
-                session_id=session_id,
-                user_id=user_id,
-                title=request.title,
-                extra_data=request.extra_data
-            )
-            
-            return ConversationResponse(
-                id=conversation.id,
-                title=conversation.title,
-                created_at=conversation.created_at.isoformat(),
-                updated_at=conversation.updated_at.isoformat(),
-                extra_data=conversation.extra_data
-            )
+        conversation = await create_conversation(
+            db,
+            session_id=session_id,
+            user_id=user_id,
+            title=request.title,
+            extra_data=request.extra_data
+        )
+        
+        # model_construct skips validation: the values come from typed ORM columns
+        return ConversationResponse.model_construct(
+            id=conversation.id,
+            title=conversation.title,
+            created_at=conversation.created_at.isoformat(),
+            updated_at=conversation.updated_at.isoformat(),
+            extra_data=conversation.extra_data
+        )
     except Exception as e:
         logger.exception(f"Error creating conversation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/query")
+@app.post("/api/query", openapi_extra=body_schema(QueryRequest))
 async def process_query(
-    request: QueryRequest,
+    request: QueryRequest = Depends(json_body(QueryRequest)),
     runtime: EnhancedAgentRuntime = Depends(get_runtime),
-    session_id: Optional[str] = Depends(get_session_from_token),
-    user_id: Optional[str] = Depends(get_user_from_session)
+    session_context: Tuple[Optional[str], Optional[str]] = Depends(get_session_context),
+    header_session_token: Optional[str] = Header(None, alias="X-Session-Token"),
+    db: AsyncSession = Depends(db_session_dep)
 ):
     """Process a query with database persistence."""
+    session_id, user_id = session_context
     try:
-        # Use session token from request if provided
-        if request.session_token:
-            async with get_db() as db:
-                session = await get_session(db, request.session_token)
-                if session:
-                    session_id = session.id
-                    user_id = session.user_id
+        # Use session token from request if provided and not already resolved from the header
+        if request.session_token and request.session_token != header_session_token:
+            body_session_id, body_user_id = await resolve_session(db, request.session_token)
+            if body_session_id:
+                session_id = body_session_id
+                user_id = body_user_id
         
         # Use user_id from request if provided
         if request.user_id:
@@ -237,7 +295,7 @@ async def process_query(
         
         if request.stream:
             return StreamingResponse(
-                stream_query_response(request, runtime, session_id, user_id),
+                coalesce_frames(stream_query_response(request, runtime, session_id, user_id)),
                 media_type="text/event-stream",
                 headers={
                     "Cache-Control": "no-cache",
@@ -252,7 +310,7 @@ async def process_query(
                 user_id=user_id,
                 verbose=request.verbose
             )
-            return result
+            return ORJSONResponse(result)
     except Exception as e:
         logger.exception(f"Error processing query: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -265,7 +323,7 @@ async def stream_query_response(
 ):
     """Stream query response with persistence."""
     try:
-        yield f"data: {json.dumps({'status': 'processing', 'query': request.query})}\n\n"
+        yield sse_event({'status': 'processing', 'query': request.query})
         
         async for chunk in runtime.stream_process_query_with_persistence(
             query=request.query,
@@ -274,18 +332,17 @@ async def stream_query_response(
             user_id=user_id,
             verbose=request.verbose
         ):
-            if isinstance(chunk, dict):
-                yield f"data: {json.dumps(chunk)}\n\n"
-            else:
-                yield f"data: {json.dumps({'content': str(chunk)})}\n\n"
+            yield sse_event(chunk)
         
-        yield "data: [DONE]\n\n"
+        yield b"data: [DONE]\n\n"
     except Exception as e:
         logger.exception(f"Error in streaming response: {e}")
-        yield f"data: {json.dumps({'error': str(e)})}\n\n"
-        yield "data: [DONE]\n\n"
+        yield sse_event({'error': str(e)})
+        yield b"data: [DONE]\n\n"
 
-@app.get("/api/conversations/{conversation_id}", response_model=ConversationResponse)
+# Read endpoints return trusted DB data as ORJSONResponse directly, skipping
+# response-model validation; the models stay in the OpenAPI docs via responses
+@app.get("/api/conversations/{conversation_id}", responses={200: {"model": ConversationResponse}})
 async def get_conversation(
     conversation_id: str,
     runtime: EnhancedAgentRuntime = Depends(get_runtime)
@@ -296,33 +353,51 @@ async def get_conversation(
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
         
-        return ConversationResponse(
-            id=conversation["id"],
-            title=conversation["title"],
-            created_at=conversation["created_at"],
-            updated_at=conversation["updated_at"],
-            extra_data=conversation["extra_data"],
-            messages=conversation["messages"]
-        )
+        return ORJSONResponse(conversation)
     except HTTPException:
         raise
     except Exception as e:
         logger.exception(f"Error getting conversation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def parse_conversation_cursor(before: Optional[str]) -> Optional[Tuple[datetime, str]]:
+    """Split a "<updated_at>,<id>" paging cursor, rejecting malformed ones with a 400."""
+    if not before:
+        return None
+    try:
+        updated_at, conversation_id = before.split(",")
+        return datetime.fromisoformat(updated_at), str(uuid.UUID(conversation_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="before must be '<updated_at>,<id>' of a listed conversation")
+
 @app.get("/api/conversations")
 async def list_conversations(
     limit: int = 50,
-    user_id: Optional[str] = Depends(get_user_from_session),
+    before: Optional[str] = None,
+    session_token: Optional[str] = Header(None, alias="X-Session-Token"),
     runtime: EnhancedAgentRuntime = Depends(get_runtime)
 ):
-    """List user conversations."""
+    """List user conversations.
+    
+    Pages further back by passing the returned next_before (the last conversation's
+    "<updated_at>,<id>") as before.
+    """
+    cursor = parse_conversation_cursor(before)
     try:
+        # Anonymous callers have no conversations; skip the session lookup entirely
+        if not session_token:
+            return ORJSONResponse({"conversations": []})
+        
+        _, user_id = await resolve_session(None, session_token)
         if not user_id:
-            return {"conversations": []}
+            return ORJSONResponse({"conversations": []})
         
-        conversations = await runtime.list_user_conversations(user_id, limit)
-        return {"conversations": conversations}
+        conversations = await runtime.list_user_conversations(user_id, limit, cursor=cursor)
+        response = {"conversations": conversations}
+        if len(conversations) == limit:
+            last = conversations[-1]
+            response["next_before"] = f"{last['updated_at']},{last['id']}"
+        return ORJSONResponse(response)
     except Exception as e:
         logger.exception(f"Error listing conversations: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -349,20 +424,7 @@ async def delete_conversation(
 async def list_agents(runtime: EnhancedAgentRuntime = Depends(get_runtime)):
     """List all available agents."""
     try:
-        agents = runtime.get_all_agents()
-        result = []
-        
-        for agent_id, agent in agents.items():
-            result.append({
-                "id": agent.id,
-                "name": agent.name,
-                "description": agent.description,
-                "capabilities": agent.capabilities,
-                "conversation_starters": agent.conversation_starters,
-                "endpoint": agent.endpoint
-            })
-        
-        return {"agents": result}
+        return Response(content=agents_payload(runtime), media_type="application/json")
     except Exception as e:
         logger.exception(f"Error listing agents: {e}")
         raise HTTPException(status_code=500, detail=str(e))
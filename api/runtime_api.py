@@ -1,19 +1,23 @@
 #!/usr/bin/env python3
 
 import asyncio
-import json
 import logging
 import time
 import uuid
-from typing import Any, Dict, List, Optional
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple, Type
 
+import orjson
 import uvicorn
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from fastapi.responses import ORJSONResponse, Response
 from starlette.responses import StreamingResponse
 
-from runtime.agent_runtime import AgentGroupChat, AgentRuntime, AgentTerminationStrategy
+from api.sse import coalesce_frames, sse_event
+from runtime.agent_runtime import AgentGroupChat, AgentRuntime, AgentTerminationStrategy, create_streaming_task, utc_timestamp
 
 # Configure logging
 logging.basicConfig(
@@ -23,7 +27,18 @@ logging.basicConfig(
 logger = logging.getLogger("runtime_api")
 logger.setLevel(logging.ERROR)
 
-app = FastAPI(title="Agent Runtime API", version="0.3.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build and warm the runtime before serving so the first request skips cold start."""
+    runtime = AgentRuntime()
+    await runtime.initialize()
+    app.state.runtime = runtime
+    yield
+    await runtime.aclose()
+
+
+app = FastAPI(title="Agent Runtime API", version="0.3.0", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -36,8 +51,15 @@ app.add_middleware(
 
 # Pydantic models for request/response
 
+# Request models ignore unknown fields rather than validating them
+REQUEST_MODEL_CONFIG = ConfigDict(extra="ignore", populate_by_name=True, str_strip_whitespace=False)
+
+_uuid4 = uuid.uuid4
+
 
 class Query(BaseModel):
+    model_config = REQUEST_MODEL_CONFIG
+
     query: str
     user_id: str = "user"
     conversation_id: Optional[str] = None
@@ -47,6 +69,8 @@ class Query(BaseModel):
 
 
 class GroupChatQuery(BaseModel):
+    model_config = REQUEST_MODEL_CONFIG
+
     query: str
     user_id: str = "user"
     conversation_id: Optional[str] = None
@@ -57,12 +81,14 @@ class GroupChatQuery(BaseModel):
 
 
 class Message(BaseModel):
-    messageId: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    model_config = REQUEST_MODEL_CONFIG
+
+    messageId: str = Field(default_factory=lambda: _uuid4().hex)
     conversationId: str
     senderId: str
     recipientId: str
     content: str
-    timestamp: str = Field(default_factory=lambda: time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+    timestamp: str = Field(default_factory=utc_timestamp)
     type: Any = "Text"
     execution_trace: Optional[List[Any]] = None
     agents_used: Optional[List[str]] = None
@@ -81,22 +107,57 @@ class Conversation(BaseModel):
     messages: List[Dict[str, Any]]
 
 
-# Singleton runtime instance
-_runtime_instance: Optional[AgentRuntime] = None
+def json_body(model: Type[BaseModel]):
+    """Dependency that validates the raw request body in a single pass with model_validate_json."""
+    async def parse(request: Request):
+        try:
+            return model.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(e.errors(include_url=False))
+    return parse
+
+
+def body_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """OpenAPI request body for endpoints that parse their body with json_body."""
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": model.model_json_schema()}}}}
+
 
+# Pre-serialized /api/agents body, keyed on the runtime's agent registry
+AGENTS_CACHE_TTL = 60.0
+_agents_cache: Optional[Tuple[Tuple[int, int], float, bytes]] = None
 
-async def get_runtime():
-    """Get or create the AgentRuntime instance."""
-    global _runtime_instance
-    if _runtime_instance is None:
-        _runtime_instance = AgentRuntime()
-        # Short delay to allow kernel initialization
-        await asyncio.sleep(1)
-    return _runtime_instance
+
+def agents_payload(runtime: AgentRuntime) -> bytes:
+    """Return the /api/agents JSON body, rebuilding it only when the registry changes or the TTL lapses."""
+    global _agents_cache
+    key = (id(runtime.agents), runtime.agents_version)
+    now = time.monotonic()
+    if _agents_cache is not None and _agents_cache[0] == key and _agents_cache[1] > now:
+        return _agents_cache[2]
+
+    result = [
+        {
+            "id": agent.id,
+            "name": agent.name,
+            "description": agent.description,
+            "capabilities": agent.capabilities,
+            "conversation_starters": agent.conversation_starters,
+            "endpoint": agent.endpoint
+        }
+        for agent in runtime.get_all_agents().values()
+    ]
+    payload = orjson.dumps({"agents": result})
+    _agents_cache = (key, now + AGENTS_CACHE_TTL, payload)
+    return payload
 
 
-@app.post("/api/query")
-async def process_query(query: Query, runtime: AgentRuntime = Depends(get_runtime)):
+async def get_runtime(request: Request) -> AgentRuntime:
+    """Get the AgentRuntime built during application startup."""
+    return request.app.state.runtime
+
+
+@app.post("/api/query", openapi_extra=body_schema(Query))
+async def process_query(query: Query = Depends(json_body(Query)), runtime: AgentRuntime = Depends(get_runtime)):
     """Process a query using the agent runtime."""
     logger.info(f"Received query: {query.query}")
 
@@ -107,7 +168,7 @@ async def process_query(query: Query, runtime: AgentRuntime = Depends(get_runtim
         if use_streaming:
             logger.debug("Streaming response requested")
             return StreamingResponse(
-                stream_query_response(query, runtime),
+                coalesce_frames(stream_query_response(query, runtime)),
                 media_type="text/event-stream"
             )
 
@@ -118,9 +179,9 @@ async def process_query(query: Query, runtime: AgentRuntime = Depends(get_runtim
             max_agents=query.max_agents
         )
 
-        # The result is already a Message object, so we can return it directly
+        # The result is already a message dict; serialize it with orjson directly
         logger.debug(f"Query processed successfully: {result.get('content', '')[:50]}...")
-        return result
+        return ORJSONResponse(result)
     except Exception as e:
         logger.exception(f"Error processing query: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -133,17 +194,14 @@ async def stream_query_response(query: Query, runtime: AgentRuntime):
     try:
         # Send an initial message to confirm streaming has started
         logger.debug("Sending initial streaming message")
-        yield f"data: {json.dumps({'chunk': 'Starting streaming response...', 'complete': False})}\n\n"
+        yield sse_event({'chunk': 'Starting streaming response...', 'complete': False})
 
         # Log the streaming process
         logger.debug(f"Starting stream_process_query with conversation_id: {query.conversation_id}")
 
-        # Create a counter for chunks
+        # Create a counter for chunks; per-chunk logging is only formatted when enabled
         chunk_counter = 0
-
-        # Set response flush interval to ensure real-time updates
-        flush_interval = 0.05  # 50ms
-        last_flush_time = time.time()
+        debug = logger.isEnabledFor(logging.DEBUG)
 
         async for chunk in runtime.stream_process_query(
             query=query.query,
@@ -151,38 +209,38 @@ async def stream_query_response(query: Query, runtime: AgentRuntime):
             verbose=query.verbose
         ):
             chunk_counter += 1
-            logger.debug(f"Streaming chunk #{chunk_counter}: {chunk if isinstance(chunk, str) else str(chunk)[:100]}...")
+            if debug:
+                logger.debug("Streaming chunk #%d: %.100s...", chunk_counter, chunk)
 
             # Format and send the chunk
             if isinstance(chunk, str):
                 # If it's a string, wrap it in a content object
-                logger.debug(f"Yielding string chunk #{chunk_counter}")
-                yield f"data: {json.dumps({'content': chunk})}\n\n"
+                yield sse_event({'content': chunk})
             else:
                 # If it's an object, send it as is
-                logger.debug(f"Yielding object chunk #{chunk_counter}")
-                yield f"data: {json.dumps(chunk)}\n\n"
-
-            # Flush data more frequently for agent calls/responses
-            current_time = time.time()
-            if 'agent_call' in chunk or 'agent_response' in chunk or (current_time - last_flush_time > flush_interval):
-                await asyncio.sleep(0)  # Yield control to ensure data is flushed
-                last_flush_time = current_time
+                yield sse_event(chunk)
 
         # Send a final message to confirm streaming is complete
         logger.debug("Sending streaming complete message")
-        yield f"data: {json.dumps({'chunk': 'Streaming complete', 'complete': True})}\n\n"
+        yield sse_event({'chunk': 'Streaming complete', 'complete': True})
 
         logger.debug("Sending [DONE] marker")
-        yield "data: [DONE]\n\n"
+        yield b"data: [DONE]\n\n"
     except Exception as e:
         logger.exception(f"Error streaming response: {e}")
-        yield f"data: {json.dumps({'error': str(e)})}\n\n"
-        yield "data: [DONE]\n\n"
+        yield sse_event({'error': str(e)})
+        yield b"data: [DONE]\n\n"
 
 
-@app.post("/api/group-chat")
-async def group_chat(query: GroupChatQuery, runtime: AgentRuntime = Depends(get_runtime)):
+def group_chat_agents(runtime: AgentRuntime, agent_ids: Optional[List[str]]) -> List[Any]:
+    """Resolve requested agent ids to agents, looking each id up once; all agents if none given."""
+    if not agent_ids:
+        return list(runtime.get_all_agents().values())
+    return [agent for agent_id in agent_ids if (agent := runtime.get_agent_by_id(agent_id)) is not None]
+
+
+@app.post("/api/group-chat", openapi_extra=body_schema(GroupChatQuery))
+async def group_chat(query: GroupChatQuery = Depends(json_body(GroupChatQuery)), runtime: AgentRuntime = Depends(get_runtime)):
     """Process a user query using a group chat of agents."""
     try:
         # Check if streaming is requested or enabled globally
@@ -191,15 +249,13 @@ async def group_chat(query: GroupChatQuery, runtime: AgentRuntime = Depends(get_
         if use_streaming:
             logger.debug("Streaming group chat response requested")
             return StreamingResponse(
-                stream_group_chat_response(query, runtime),
+                coalesce_frames(stream_group_chat_response(query, runtime)),
                 media_type="text/event-stream"
             )
 
         # Create a group chat with specified agents
         group_chat = AgentGroupChat(
-            agents=[runtime.get_agent_by_id(agent_id) for agent_id in query.agent_ids
-                    if runtime.get_agent_by_id(agent_id) is not None]
-            if query.agent_ids else list(runtime.get_all_agents().values()),
+            agents=group_chat_agents(runtime, query.agent_ids),
             termination_strategy=AgentTerminationStrategy(max_iterations=query.max_iterations)
         )
 
@@ -211,11 +267,15 @@ async def group_chat(query: GroupChatQuery, runtime: AgentRuntime = Depends(get_
             verbose=query.verbose
         )
 
-        return response
+        return ORJSONResponse(response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing group chat: {str(e)}")
 
 
+# Queued after a group chat's last event to end the stream
+EVENTS_DONE = object()
+
+
 async def stream_group_chat_response(query: GroupChatQuery, runtime: AgentRuntime):
     """Stream the response to a group chat query."""
     logger.debug(f"Starting streaming group chat response for query: {query.query}")
@@ -225,85 +285,67 @@ async def stream_group_chat_response(query: GroupChatQuery, runtime: AgentRuntim
         response = {"content": "", "agents_used": []}
         
         # Send an initial message to confirm streaming has started
-        yield f"data: {json.dumps({'chunk': 'Starting group chat streaming response...', 'complete': False})}\n\n"
+        yield sse_event({'chunk': 'Starting group chat streaming response...', 'complete': False})
 
         # Create a group chat with specified agents
         group_chat = AgentGroupChat(
-            agents=[runtime.get_agent_by_id(agent_id) for agent_id in query.agent_ids
-                    if runtime.get_agent_by_id(agent_id) is not None]
-            if query.agent_ids else list(runtime.get_all_agents().values()),
+            agents=group_chat_agents(runtime, query.agent_ids),
             termination_strategy=AgentTerminationStrategy(max_iterations=query.max_iterations)
         )
 
-        # Set up event queue for the group chat
-        # This is a temporary approach until the group chat is fully integrated with streaming
-        runtime.event_queue = asyncio.Queue()
-
-        # Set event queue on agents temporarily
-        for agent in runtime.agents.values():
-            agent._event_queue = runtime.event_queue
-
-        # Set response flush interval to ensure real-time updates
-        flush_interval = 0.05  # 50ms
-        last_flush_time = time.time()
+        # Set up an event queue for this group chat only
+        event_queue = asyncio.Queue()
 
         # Process the query through the group chat (in background task)
-        process_task = asyncio.create_task(group_chat.process_query(
+        process_task = create_streaming_task(group_chat.process_query(
             query.query,
             user_id=query.user_id,
             conversation_id=query.conversation_id,
             verbose=query.verbose
-        ))
-
-        # Process events as they come in
-        while not process_task.done() or not runtime.event_queue.empty():
-            try:
-                # Try to get an event from the queue
-                event = await asyncio.wait_for(runtime.event_queue.get(), 0.1)
-                logger.debug(f"Got event from queue: {event}")
-
-                # Send the event to the client
-                yield f"data: {json.dumps(event)}\n\n"
-                runtime.event_queue.task_done()
-
-                # Flush data more frequently for agent calls/responses
-                current_time = time.time()
-                if 'agent_call' in event or 'agent_response' in event or (current_time - last_flush_time > flush_interval):
-                    await asyncio.sleep(0)  # Yield control to ensure data is flushed
-                    last_flush_time = current_time
-            except asyncio.TimeoutError:
-                # No event available, check if process task is done
-                if process_task.done():
-                    try:
-                        # Get the result
-                        response = process_task.result()
-                        logger.debug(f"Process task completed with response: {response}")
-                    except Exception as e:
-                        logger.exception(f"Error getting process task result: {e}")
-                        response = {"content": f"Error: {str(e)}", "agents_used": []}
-                    break
-
-        # Cleanup
-        for agent in runtime.agents.values():
-            agent._event_queue = None
+        ), event_queue)
+        # Wake the consumer once the group chat finishes, however it ends
+        process_task.add_done_callback(lambda _: event_queue.put_nowait(EVENTS_DONE))
+
+        # Process events as they come in, blocking until the next one or the end marker
+        debug = logger.isEnabledFor(logging.DEBUG)
+        while True:
+            event = await event_queue.get()
+            if event is EVENTS_DONE:
+                break
+            if debug:
+                logger.debug("Got event from queue: %s", event)
+
+            # Send the event to the client
+            yield sse_event(event)
+            event_queue.task_done()
+
+        try:
+            # Get the result
+            response = process_task.result()
+            logger.debug(f"Process task completed with response: {response}")
+        except Exception as e:
+            logger.exception(f"Error getting process task result: {e}")
+            response = {"content": f"Error: {str(e)}", "agents_used": []}
 
         # Stream the final response content
         if response and "content" in response:
-            yield f"data: {json.dumps({'content': response['content']})}\n\n"
+            yield sse_event({'content': response['content']})
 
         # Send the complete response
-        yield f"data: {json.dumps({'chunk': None, 'complete': True, 'response': response.get('content', ''), 'agents_used': response.get('agents_used', [])})}\n\n"
+        yield sse_event({'chunk': None, 'complete': True, 'response': response.get('content', ''), 'agents_used': response.get('agents_used', [])})
 
         # Send a final message to confirm streaming is complete
-        yield f"data: {json.dumps({'chunk': 'Group chat streaming complete', 'complete': True})}\n\n"
-        yield "data: [DONE]\n\n"
+        yield sse_event({'chunk': 'Group chat streaming complete', 'complete': True})
+        yield b"data: [DONE]\n\n"
     except Exception as e:
         logger.exception(f"Error streaming group chat response: {e}")
-        yield f"data: {json.dumps({'error': str(e)})}\n\n"
-        yield "data: [DONE]\n\n"
+        yield sse_event({'error': str(e)})
+        yield b"data: [DONE]\n\n"
 
 
-@app.get("/api/conversations/{conversation_id}", response_model=Conversation)
+# Read endpoints return ORJSONResponse directly, skipping response-model
+# validation; the model stays in the OpenAPI docs via responses
+@app.get("/api/conversations/{conversation_id}", responses={200: {"model": Conversation}})
 async def get_conversation(conversation_id: str, runtime: AgentRuntime = Depends(get_runtime)):
     """Get the conversation history for a specific conversation."""
     try:
@@ -312,10 +354,10 @@ async def get_conversation(conversation_id: str, runtime: AgentRuntime = Depends
         if not history:
             raise HTTPException(status_code=404, detail=f"Conversation {conversation_id} not found")
 
-        return {
+        return ORJSONResponse({
             "id": conversation_id,
             "messages": history
-        }
+        })
     except HTTPException:
         raise
     except Exception as e:
@@ -326,39 +368,30 @@ async def get_conversation(conversation_id: str, runtime: AgentRuntime = Depends
 async def list_agents(runtime: AgentRuntime = Depends(get_runtime)):
     """List all available agents and their capabilities."""
     try:
-        agents = runtime.get_all_agents()
-        result = []
-
-        for agent_id, agent in agents.items():
-            result.append({
-                "id": agent.id,
-                "name": agent.name,
-                "description": agent.description,
-                "capabilities": agent.capabilities,
-                "conversation_starters": agent.conversation_starters,
-                "endpoint": agent.endpoint
-            })
-
-        return {"agents": result}
+        return Response(content=agents_payload(runtime), media_type="application/json")
     except Exception as e:
         logger.error(f"Error listing agents: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Failed to list agents: {str(e)}")
 
 
+# The root listing never changes, so it is serialized once at import
+ROOT_PAYLOAD = orjson.dumps({
+    "name": "Agent Runtime API",
+    "version": "0.3.0",
+    "description": "An API for orchestrating interactions between agents using Semantic Kernel",
+    "endpoints": [
+        {"path": "/api/query", "method": "POST", "description": "Process a user query"},
+        {"path": "/api/group-chat", "method": "POST", "description": "Process a query using a group chat of agents"},
+        {"path": "/api/conversations/{conversation_id}", "method": "GET", "description": "Get conversation history"},
+        {"path": "/api/agents", "method": "GET", "description": "List available agents"}
+    ]
+})
+
+
 @app.get("/")
 async def root():
     """Root endpoint providing API information."""
-    return {
-        "name": "Agent Runtime API",
-        "version": "0.3.0",
-        "description": "An API for orchestrating interactions between agents using Semantic Kernel",
-        "endpoints": [
-            {"path": "/api/query", "method": "POST", "description": "Process a user query"},
-            {"path": "/api/group-chat", "method": "POST", "description": "Process a query using a group chat of agents"},
-            {"path": "/api/conversations/{conversation_id}", "method": "GET", "description": "Get conversation history"},
-            {"path": "/api/agents", "method": "GET", "description": "List available agents"}
-        ]
-    }
+    return Response(content=ROOT_PAYLOAD, media_type="application/json")
 
 if __name__ == "__main__":
     # Start the server
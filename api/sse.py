@@ -0,0 +1,91 @@
+"""Server-sent event framing and write coalescing shared by the runtime APIs."""
+
+import asyncio
+from typing import Any, AsyncIterator
+
+import orjson
+
+# SSE frames are coalesced up to this size, holding them no longer than the delay
+SSE_BATCH_BYTES = 4096
+SSE_BATCH_DELAY = 0.02
+
+# Queued after the source's last frame to end the stream
+FRAMES_DONE = object()
+
+
+class UrgentFrame(bytes):
+    """A frame that is written out with everything batched before it, without waiting."""
+
+
+def sse_event(data: Any) -> bytes:
+    """Frame a payload as a server-sent event, serialized with orjson.
+
+    Events flagged "priority" (agent hand-offs) come back as UrgentFrame so
+    coalesce_frames sends them straight away.
+    """
+    frame = b"data: " + orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS) + b"\n\n"
+    if type(data) is dict and data.get("priority"):
+        return UrgentFrame(frame)
+    return frame
+
+
+async def coalesce_frames(frames: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Merge small SSE frames into larger writes, flushing at SSE_BATCH_BYTES, after SSE_BATCH_DELAY or on an UrgentFrame.
+
+    One pump task drains the source for the whole stream, so frames are not each
+    awaited in a task of their own. The source is closed however the stream ends,
+    including when the client disconnects.
+    """
+    loop = asyncio.get_running_loop()
+    # Bounded so a slow client still pushes back on the source
+    queue: asyncio.Queue = asyncio.Queue(maxsize=64)
+
+    async def pump():
+        # No end marker on cancellation: nobody is left to read it, and the queue may be full
+        try:
+            async for frame in frames:
+                await queue.put(frame)
+        except Exception:
+            await queue.put(FRAMES_DONE)
+            raise
+        await queue.put(FRAMES_DONE)
+
+    pump_task = asyncio.create_task(pump())
+    buffer = bytearray()
+    deadline = 0.0
+    try:
+        while True:
+            if not buffer:
+                frame = await queue.get()
+            elif not queue.empty():
+                frame = queue.get_nowait()
+            else:
+                try:
+                    async with asyncio.timeout_at(deadline):
+                        frame = await queue.get()
+                except TimeoutError:
+                    # The batching window closed before the next frame arrived
+                    yield bytes(buffer)
+                    buffer.clear()
+                    continue
+
+            if frame is FRAMES_DONE:
+                break
+            if not buffer:
+                deadline = loop.time() + SSE_BATCH_DELAY
+            buffer += frame
+            if len(buffer) >= SSE_BATCH_BYTES or type(frame) is UrgentFrame:
+                yield bytes(buffer)
+                buffer.clear()
+
+        if buffer:
+            yield bytes(buffer)
+        # Re-raise anything the source failed with
+        pump_task.result()
+    finally:
+        if not pump_task.done():
+            pump_task.cancel()
+            await asyncio.gather(pump_task, return_exceptions=True)
+        aclose = getattr(frames, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -1,5 +1,5 @@
 """Configuration package."""
 
-from .settings import Settings, get_settings
+from .settings import Settings, SettingsSnapshot, get_settings
 
-__all__ = ["Settings", "get_settings"]
\ No newline at end of file
+__all__ = ["Settings", "SettingsSnapshot", "get_settings"]
\ No newline at end of file
@@ -1,63 +1,74 @@
 """Application settings and configuration."""
 
 import os
+from dataclasses import make_dataclass
 from functools import lru_cache
 from typing import List, Optional
 
 from pydantic import Field
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
     """Application settings loaded from environment variables."""
     
+    # Each field is read from the environment variable of the same name
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", case_sensitive=False)
+    
     # Application
-    app_name: str = Field(default="Azure Semantic Kernel Agent Starter", env="APP_NAME")
-    app_version: str = Field(default="1.0.0", env="APP_VERSION")
-    debug: bool = Field(default=False, env="DEBUG")
-    log_level: str = Field(default="INFO", env="LOG_LEVEL")
+    app_name: str = Field(default="Azure Semantic Kernel Agent Starter")
+    app_version: str = Field(default="1.0.0")
+    debug: bool = Field(default=False)
+    log_level: str = Field(default="INFO")
     
     # API Configuration
-    api_host: str = Field(default="0.0.0.0", env="API_HOST")
-    api_port: int = Field(default=5003, env="API_PORT")
+    api_host: str = Field(default="0.0.0.0")
+    api_port: int = Field(default=5003)
     
     # Database
-    database_url: str = Field(default="sqlite+aiosqlite:///./app.db", env="DATABASE_URL")
-    sync_database_url: str = Field(default="sqlite:///./app.db", env="SYNC_DATABASE_URL")
-    database_echo: bool = Field(default=False, env="DATABASE_ECHO")
+    database_url: str = Field(default="sqlite+aiosqlite:///./app.db")
+    database_echo: bool = Field(default=False)
     
     # OpenAI
-    openai_api_key: str = Field(env="OPENAI_API_KEY")
-    openai_model: str = Field(default="gpt-4o", env="OPENAI_MODEL")
+    openai_api_key: str = Field()
+    openai_model: str = Field(default="gpt-4o")
     
     # ElevenLabs (optional)
-    elevenlabs_api_key: Optional[str] = Field(default=None, env="ELEVENLABS_API_KEY")
+    elevenlabs_api_key: Optional[str] = Field(default=None)
     
     # Agent Configuration
-    hello_agent_endpoint: str = Field(default="http://localhost:5001/api/message", env="HELLO_AGENT_ENDPOINT")
-    goodbye_agent_endpoint: str = Field(default="http://localhost:5002/api/message", env="GOODBYE_AGENT_ENDPOINT")
-    math_agent_endpoint: str = Field(default="http://localhost:5004/api/message", env="MATH_AGENT_ENDPOINT")
+    hello_agent_endpoint: str = Field(default="http://localhost:5001/api/message")
+    goodbye_agent_endpoint: str = Field(default="http://localhost:5002/api/message")
+    math_agent_endpoint: str = Field(default="http://localhost:5004/api/message")
     
     # MCP Server Configuration
-    mcp_server_host: str = Field(default="0.0.0.0", env="MCP_SERVER_HOST")
-    mcp_server_port: int = Field(default=5005, env="MCP_SERVER_PORT")
+    mcp_server_host: str = Field(default="0.0.0.0")
+    mcp_server_port: int = Field(default=5005)
     
     # CORS
-    cors_origins: List[str] = Field(default=["*"], env="CORS_ORIGINS")
+    cors_origins: List[str] = Field(default=["*"])
     
     # Session Configuration
-    session_expires_hours: int = Field(default=24 * 7, env="SESSION_EXPIRES_HOURS")  # 7 days default
+    session_expires_hours: int = Field(default=24 * 7)  # 7 days default
     
     # Container Configuration
-    container_mode: bool = Field(default=False, env="CONTAINER_MODE")
+    container_mode: bool = Field(default=False)
     
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
-        case_sensitive = False
+    # Diagnostics: log event loop callbacks that block for longer than the threshold
+    profile_blocking: bool = Field(default=False)
+    blocking_threshold_ms: float = Field(default=10.0)
+
+
+# Frozen, slotted copy of Settings so hot-path reads are plain attribute lookups
+SettingsSnapshot = make_dataclass(
+    "SettingsSnapshot",
+    [(name, field.annotation) for name, field in Settings.model_fields.items()],
+    frozen=True,
+    slots=True,
+)
 
 
 @lru_cache()
-def get_settings() -> Settings:
-    """Get cached application settings."""
-    return Settings()
\ No newline at end of file
+def get_settings() -> SettingsSnapshot:
+    """Get cached application settings, parsed once and frozen."""
+    return SettingsSnapshot(**Settings().model_dump())
\ No newline at end of file
@@ -1,8 +1,8 @@
 """Database package for session and conversation persistence."""
 
 from .models import Base, Session, Conversation, Message, User
-from .database import get_db, init_db, close_db, init_db_sync
-from .session import get_session, create_session, delete_session, create_conversation, get_conversation
+from .database import get_db, init_db, close_db
+from .session import get_session, create_session, delete_session, create_conversation, delete_conversation, get_conversation, get_conversation_with_messages
 
 __all__ = [
     "Base",
@@ -13,10 +13,11 @@ __all__ = [
     "get_db",
     "init_db", 
     "close_db",
-    "init_db_sync",
     "get_session",
     "create_session",
     "delete_session",
     "create_conversation",
-    "get_conversation"
+    "delete_conversation",
+    "get_conversation",
+    "get_conversation_with_messages"
 ]
\ No newline at end of file
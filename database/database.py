@@ -4,43 +4,65 @@ import os
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
-from sqlalchemy import create_engine
+import orjson
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-from sqlalchemy.orm import Session, sessionmaker
 
 from .models import Base
 
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./app.db")  # Default to SQLite with async support
-SYNC_DATABASE_URL = os.getenv("SYNC_DATABASE_URL", "sqlite:///./app.db")  # Sync version for migrations
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+
+def _json_dumps(value) -> str:
+    """Serialize JSON columns with orjson; non-string keys are coerced like the json module does."""
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+# SQLite is an in-process file, so pooled connections need no liveness ping and
+# lock waits are handled by the driver timeout; server databases get a fixed-size pool.
+# Recycling retires connections before server idle timeouts, so the per-checkout
+# liveness ping is opt-in rather than a round trip on every request.
+if IS_SQLITE:
+    ENGINE_OPTIONS = {"connect_args": {"timeout": 30}}
+else:
+    ENGINE_OPTIONS = {
+        "pool_pre_ping": os.getenv("DATABASE_POOL_PRE_PING", "false").lower() == "true",
+        "pool_size": int(os.getenv("DATABASE_POOL_SIZE", "32")),
+        "max_overflow": int(os.getenv("DATABASE_MAX_OVERFLOW", "0")),
+        "pool_timeout": int(os.getenv("DATABASE_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DATABASE_POOL_RECYCLE", "1800")),
+    }
 
 # Async engine for main application
 async_engine = create_async_engine(
     DATABASE_URL,
     echo=os.getenv("DATABASE_ECHO", "false").lower() == "true",
-    pool_pre_ping=True,
+    json_serializer=_json_dumps,
+    json_deserializer=orjson.loads,
+    **ENGINE_OPTIONS,
 )
 
-# Sync engine for migrations and setup
-sync_engine = create_engine(
-    SYNC_DATABASE_URL,
-    echo=os.getenv("DATABASE_ECHO", "false").lower() == "true",
-    pool_pre_ping=True,
-)
-
-# Session makers
+if IS_SQLITE:
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Use WAL so readers don't block the writer; set once per new connection."""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+# Session maker
 AsyncSessionLocal = async_sessionmaker(
     bind=async_engine,
     class_=AsyncSession,
     expire_on_commit=False,
 )
 
-SyncSessionLocal = sessionmaker(
-    bind=sync_engine,
-    autocommit=False,
-    autoflush=False,
-)
-
 
 async def init_db() -> None:
     """Initialize the database by creating all tables."""
@@ -48,11 +70,6 @@ async def init_db() -> None:
         await conn.run_sync(Base.metadata.create_all)
 
 
-def init_db_sync() -> None:
-    """Initialize the database synchronously (for migrations and setup)."""
-    Base.metadata.create_all(bind=sync_engine)
-
-
 async def close_db() -> None:
     """Close the database connection."""
     await async_engine.dispose()
@@ -60,18 +77,10 @@ async def close_db() -> None:
 
 @asynccontextmanager
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
-    """Get a database session."""
+    """Get a database session.
+
+    Writers commit explicitly; anything left uncommitted is rolled back when the
+    session closes, so read-only callers never pay for a COMMIT.
+    """
     async with AsyncSessionLocal() as session:
-        try:
-            yield session
-            await session.commit()
-        except Exception:
-            await session.rollback()
-            raise
-        finally:
-            await session.close()
-
-
-def get_sync_db() -> Session:
-    """Get a synchronous database session (for migrations and setup)."""
-    return SyncSessionLocal()
\ No newline at end of file
+        yield session
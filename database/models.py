@@ -4,20 +4,42 @@ import uuid
 from datetime import datetime
 from typing import List, Optional
 
-from sqlalchemy import DateTime, String, Text, ForeignKey, JSON
+from sqlalchemy import DateTime, String, Text, ForeignKey, Index, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
+from sqlalchemy.types import TypeDecorator
 
 Base = declarative_base()
 
 
+class UUIDType(TypeDecorator):
+    """UUID key stored as its 36-character string, the layout existing databases already use.
+    
+    Bound UUIDs are normalized to the canonical lower-case hyphenated form, so hex or
+    upper-case spellings of an id match the stored key. Other strings are bound unchanged.
+    """
+    
+    impl = String(36)
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return value
+        if isinstance(value, uuid.UUID):
+            return str(value)
+        try:
+            return str(uuid.UUID(value))
+        except (AttributeError, TypeError, ValueError):
+            return value
+
+
 class User(Base):
     """User model for storing user information."""
     
     __tablename__ = "users"
     
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id: Mapped[str] = mapped_column(UUIDType, primary_key=True, default=lambda: str(uuid.uuid4()))
     username: Mapped[Optional[str]] = mapped_column(String(100), unique=True, nullable=True)
     email: Mapped[Optional[str]] = mapped_column(String(255), unique=True, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
@@ -33,10 +55,10 @@ class Session(Base):
     
     __tablename__ = "sessions"
     
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id: Mapped[Optional[str]] = mapped_column(String(36), ForeignKey("users.id"), nullable=True)
+    id: Mapped[str] = mapped_column(UUIDType, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id: Mapped[Optional[str]] = mapped_column(UUIDType, ForeignKey("users.id"), nullable=True)
     session_token: Mapped[str] = mapped_column(String(255), unique=True, index=True)
-    expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
     extra_data: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)
@@ -50,10 +72,14 @@ class Conversation(Base):
     """Conversation model for storing conversation threads."""
     
     __tablename__ = "conversations"
+    __table_args__ = (
+        # Serves a user's most-recent-first listing and its (updated_at, id) keyset pages without a sort
+        Index("ix_conv_user_updated", "user_id", "updated_at", "id"),
+    )
     
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    session_id: Mapped[Optional[str]] = mapped_column(String(36), ForeignKey("sessions.id"), nullable=True)
-    user_id: Mapped[Optional[str]] = mapped_column(String(36), ForeignKey("users.id"), nullable=True)
+    id: Mapped[str] = mapped_column(UUIDType, primary_key=True, default=lambda: str(uuid.uuid4()))
+    session_id: Mapped[Optional[str]] = mapped_column(UUIDType, ForeignKey("sessions.id"), nullable=True)
+    user_id: Mapped[Optional[str]] = mapped_column(UUIDType, ForeignKey("users.id"), nullable=True)
     title: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
@@ -69,9 +95,13 @@ class Message(Base):
     """Message model for storing individual messages in conversations."""
     
     __tablename__ = "messages"
+    __table_args__ = (
+        # Serves the per-conversation lookup and its created_at ordering from one index
+        Index("ix_messages_conv_created", "conversation_id", "created_at"),
+    )
     
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    conversation_id: Mapped[str] = mapped_column(String(36), ForeignKey("conversations.id"), nullable=False)
+    id: Mapped[str] = mapped_column(UUIDType, primary_key=True, default=lambda: str(uuid.uuid4()))
+    conversation_id: Mapped[str] = mapped_column(UUIDType, ForeignKey("conversations.id"), nullable=False)
     role: Mapped[str] = mapped_column(String(20), nullable=False)  # user, assistant, system
     content: Mapped[str] = mapped_column(Text, nullable=False)
     sender_id: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
@@ -1,14 +1,34 @@
 """Session management utilities."""
 
+import asyncio
 import secrets
+import time
 import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 
-from sqlalchemy import select
+from sqlalchemy import delete, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
-from .models import Session as SessionModel, User, Conversation
+from .database import get_db
+from .models import Session as SessionModel, User, Conversation, Message
+
+
+@dataclass(frozen=True)
+class SessionInfo:
+    """Detached snapshot of the session fields needed to authenticate a request."""
+    id: str
+    user_id: Optional[str]
+    expires_at: Optional[datetime]
+
+
+# Recently resolved sessions by token: (cache expiry, snapshot)
+SESSION_CACHE_TTL = 60.0
+SESSION_CACHE_SIZE = 4096
+_session_cache: "OrderedDict[str, Tuple[float, SessionInfo]]" = OrderedDict()
 
 
 async def create_session(
@@ -19,69 +39,155 @@ async def create_session(
 ) -> SessionModel:
     """Create a new session."""
     session_token = secrets.token_urlsafe(32)
-    expires_at = datetime.utcnow() + timedelta(hours=expires_in_hours)
+    # Timestamps are set here rather than by the column defaults so the
+    # returned object is complete without a refresh round trip
+    now = datetime.utcnow()
+    expires_at = now + timedelta(hours=expires_in_hours)
     
     session = SessionModel(
         user_id=user_id,
         session_token=session_token,
         expires_at=expires_at,
+        created_at=now,
+        updated_at=now,
         extra_data=extra_data or {}
     )
     
     db.add(session)
     await db.commit()
-    await db.refresh(session)
     
     return session
 
 
 async def get_session(db: AsyncSession, session_token: str) -> Optional[SessionModel]:
-    """Get a session by token."""
-    stmt = select(SessionModel).where(SessionModel.session_token == session_token)
+    """Get a session by token, treating expired sessions as missing."""
+    # expires_at is naive UTC from the application clock, so expiry is checked against
+    # that clock too, as delete_expired_sessions does; it removes the rows later
+    stmt = select(SessionModel).where(
+        SessionModel.session_token == session_token,
+        or_(SessionModel.expires_at.is_(None), SessionModel.expires_at > datetime.utcnow())
+    )
     result = await db.execute(stmt)
-    session = result.scalar_one_or_none()
+    return result.scalar_one_or_none()
+
+
+async def get_session_info(db: Optional[AsyncSession], session_token: str) -> Optional[SessionInfo]:
+    """Get a session snapshot by token, serving recently seen tokens from memory.
+
+    Without a caller session, one is opened only when the token isn't cached.
+    """
+    now = time.monotonic()
+    cached = _session_cache.get(session_token)
+    if cached and cached[0] > now:
+        _session_cache.move_to_end(session_token)
+        return cached[1]
     
-    # Check if session is expired
-    if session and session.expires_at and session.expires_at < datetime.utcnow():
-        await delete_session(db, session_token)
+    if db is None:
+        async with get_db() as db:
+            session = await get_session(db, session_token)
+    else:
+        session = await get_session(db, session_token)
+    if not session:
+        _session_cache.pop(session_token, None)
         return None
     
-    return session
+    info = SessionInfo(id=session.id, user_id=session.user_id, expires_at=session.expires_at)
+    # Never cache a session past its own expiry
+    ttl = SESSION_CACHE_TTL
+    if info.expires_at:
+        ttl = min(ttl, (info.expires_at - datetime.utcnow()).total_seconds())
+    _session_cache[session_token] = (now + ttl, info)
+    _session_cache.move_to_end(session_token)
+    if len(_session_cache) > SESSION_CACHE_SIZE:
+        _session_cache.popitem(last=False)
+    return info
+
+
+async def delete_expired_sessions(db: AsyncSession) -> int:
+    """Delete every expired session with its conversations and messages; return the count."""
+    now = datetime.utcnow()
+    session_ids = select(SessionModel.id).where(SessionModel.expires_at <= now)
+    conversation_ids = select(Conversation.id).where(Conversation.session_id.in_(session_ids))
+    await db.execute(
+        delete(Message).where(Message.conversation_id.in_(conversation_ids)),
+        execution_options={"synchronize_session": False}
+    )
+    await db.execute(
+        delete(Conversation).where(Conversation.session_id.in_(session_ids)),
+        execution_options={"synchronize_session": False}
+    )
+    result = await db.execute(
+        delete(SessionModel).where(SessionModel.expires_at <= now),
+        execution_options={"synchronize_session": False}
+    )
+    await db.commit()
+    # Cached snapshots carry their own expiry, but drop them with the rows
+    _session_cache.clear()
+    return result.rowcount
 
 
 async def delete_session(db: AsyncSession, session_token: str) -> bool:
-    """Delete a session by token."""
-    stmt = select(SessionModel).where(SessionModel.session_token == session_token)
-    result = await db.execute(stmt)
-    session = result.scalar_one_or_none()
-    
-    if session:
-        await db.delete(session)
-        await db.commit()
-        return True
-    
-    return False
+    """Delete a session by token, along with its conversations and their messages."""
+    _session_cache.pop(session_token, None)
+    # Bulk deletes skip the ORM cascade, so dependent rows are removed explicitly
+    session_ids = select(SessionModel.id).where(SessionModel.session_token == session_token)
+    conversation_ids = select(Conversation.id).where(Conversation.session_id.in_(session_ids))
+    await db.execute(
+        delete(Message).where(Message.conversation_id.in_(conversation_ids)),
+        execution_options={"synchronize_session": False}
+    )
+    await db.execute(
+        delete(Conversation).where(Conversation.session_id.in_(session_ids)),
+        execution_options={"synchronize_session": False}
+    )
+    result = await db.execute(
+        delete(SessionModel).where(SessionModel.session_token == session_token),
+        execution_options={"synchronize_session": False}
+    )
+    await db.commit()
+    return result.rowcount > 0
+
+
+# The anonymous user's id is stable, so it is looked up once per process
+_anonymous_user_id: Optional[str] = None
+_anonymous_user_lock = asyncio.Lock()
 
 
 async def get_or_create_anonymous_user(db: AsyncSession) -> User:
     """Get or create an anonymous user for sessionless interactions."""
-    # Look for existing anonymous user
-    stmt = select(User).where(User.username == "anonymous")
-    result = await db.execute(stmt)
-    user = result.scalar_one_or_none()
+    global _anonymous_user_id
+    
+    if _anonymous_user_id is not None:
+        user = await db.get(User, _anonymous_user_id)
+        if user:
+            return user
     
-    if not user:
-        user = User(
-            username="anonymous",
-            email=None
-        )
-        db.add(user)
-        await db.commit()
-        await db.refresh(user)
+    async with _anonymous_user_lock:
+        # Look for existing anonymous user
+        stmt = select(User).where(User.username == "anonymous")
+        result = await db.execute(stmt)
+        user = result.scalar_one_or_none()
+        
+        if not user:
+            user = User(
+                username="anonymous",
+                email=None
+            )
+            db.add(user)
+            await db.commit()
+        
+        _anonymous_user_id = user.id
     
     return user
 
 
+async def get_anonymous_user_id(db: AsyncSession) -> str:
+    """Get the anonymous user's id, skipping the database once it is known."""
+    if _anonymous_user_id is None:
+        await get_or_create_anonymous_user(db)
+    return _anonymous_user_id
+
+
 async def create_conversation(
     db: AsyncSession,
     session_id: Optional[str] = None,
@@ -90,22 +196,49 @@ async def create_conversation(
     extra_data: Optional[dict] = None
 ) -> Conversation:
     """Create a new conversation."""
+    now = datetime.utcnow()
     conversation = Conversation(
         session_id=session_id,
         user_id=user_id,
         title=title,
+        created_at=now,
+        updated_at=now,
         extra_data=extra_data or {}
     )
     
     db.add(conversation)
     await db.commit()
-    await db.refresh(conversation)
     
     return conversation
 
 
+async def delete_conversation(db: AsyncSession, conversation_id: str) -> bool:
+    """Delete a conversation and its messages without loading them."""
+    await db.execute(
+        delete(Message).where(Message.conversation_id == conversation_id),
+        execution_options={"synchronize_session": False}
+    )
+    result = await db.execute(
+        delete(Conversation).where(Conversation.id == conversation_id),
+        execution_options={"synchronize_session": False}
+    )
+    await db.commit()
+    return result.rowcount > 0
+
+
 async def get_conversation(db: AsyncSession, conversation_id: str) -> Optional[Conversation]:
     """Get a conversation by ID."""
     stmt = select(Conversation).where(Conversation.id == conversation_id)
     result = await db.execute(stmt)
+    return result.scalar_one_or_none()
+
+
+async def get_conversation_with_messages(db: AsyncSession, conversation_id: str) -> Optional[Conversation]:
+    """Get a conversation by ID with its messages loaded in one additional IN query."""
+    stmt = (
+        select(Conversation)
+        .options(selectinload(Conversation.messages))
+        .where(Conversation.id == conversation_id)
+    )
+    result = await db.execute(stmt)
     return result.scalar_one_or_none()
\ No newline at end of file
@@ -9,13 +9,19 @@ import os
 import signal
 import subprocess
 import sys
-import time
 from concurrent.futures import ProcessPoolExecutor
 from typing import List, Optional
 
+import httpx
 import uvicorn
 from config import get_settings
-from database import init_db_sync
+from database import close_db, init_db
+
+try:
+    # Installed with uvicorn[standard]; there is no Windows build
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # Configure logging
 logging.basicConfig(
@@ -26,41 +32,70 @@ logger = logging.getLogger("main")
 
 settings = get_settings()
 
+# Agent subprocess output goes here so unread pipes can never fill and block them
+LOG_DIR = "logs"
+
 
 class ServiceManager:
     """Manages multiple services in a single container."""
     
     def __init__(self):
-        self.processes: List[subprocess.Popen] = []
+        self.processes: List[asyncio.subprocess.Process] = []
         self.shutdown_event = asyncio.Event()
         
-    def start_agent_service(self, agent_name: str, port: int, script_path: str) -> subprocess.Popen:
+    async def start_agent_service(self, agent_name: str, port: int, script_path: str) -> asyncio.subprocess.Process:
         """Start an agent service."""
         env = os.environ.copy()
         env['PORT'] = str(port)
         
-        if agent_name == "goodbye_agent":
-            # .NET agent
-            cwd = f"agents/{agent_name}"
-            process = subprocess.Popen(
-                ["dotnet", "run"],
-                cwd=cwd,
-                env=env,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-        else:
-            # Python agent
-            process = subprocess.Popen(
-                [sys.executable, script_path],
-                env=env,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
+        os.makedirs(LOG_DIR, exist_ok=True)
+        with open(os.path.join(LOG_DIR, f"{agent_name}.log"), "ab") as log_file:
+            if agent_name == "goodbye_agent":
+                # .NET agent
+                cwd = f"agents/{agent_name}"
+                process = await asyncio.create_subprocess_exec(
+                    "dotnet", "run",
+                    cwd=cwd,
+                    env=env,
+                    stdout=log_file,
+                    stderr=asyncio.subprocess.STDOUT
+                )
+            else:
+                # Python agent
+                process = await asyncio.create_subprocess_exec(
+                    sys.executable, script_path,
+                    env=env,
+                    stdout=log_file,
+                    stderr=asyncio.subprocess.STDOUT
+                )
         
         logger.info(f"Started {agent_name} on port {port} (PID: {process.pid})")
         return process
     
+    async def wait_for_port(
+        self,
+        port: int,
+        process: Optional[asyncio.subprocess.Process] = None,
+        timeout: float = 5.0
+    ) -> bool:
+        """Poll until something accepts connections on the local port, up to timeout seconds.
+        
+        Gives up as soon as the process expected to serve the port has exited.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            if process is not None and process.returncode is not None:
+                return False
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), timeout=0.1)
+            except (OSError, asyncio.TimeoutError):
+                await asyncio.sleep(0.1)
+            else:
+                writer.close()
+                return True
+        return False
+    
     async def start_fastapi_service(self, app_module: str, host: str, port: int):
         """Start a FastAPI service using uvicorn."""
         config = uvicorn.Config(
@@ -75,88 +110,98 @@ class ServiceManager:
         logger.info(f"Starting FastAPI service {app_module} on {host}:{port}")
         await server.serve()
     
-    def start_all_services(self):
-        """Start all services."""
-        logger.info("Starting all services...")
-        
-        # Initialize database
-        logger.info("Initializing database...")
-        init_db_sync()
-        
-        # Start agents
+    async def start_agents(self):
+        """Spawn every agent, then wait until each one is accepting connections."""
         services = [
             ("hello_agent", 5001, "agents/hello_agent/hello_agent.py"),
             ("goodbye_agent", 5002, None),  # .NET service
             ("math_agent", 5004, "agents/math_agent/math_agent.py"),
         ]
         
+        started = []
         for agent_name, port, script_path in services:
             try:
-                process = self.start_agent_service(agent_name, port, script_path)
+                process = await self.start_agent_service(agent_name, port, script_path)
                 self.processes.append(process)
-                time.sleep(2)  # Give each service time to start
+                started.append((agent_name, port, process))
             except Exception as e:
                 logger.error(f"Failed to start {agent_name}: {e}")
         
-        # Start FastAPI services asynchronously
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # Create tasks for FastAPI services
-        tasks = [
-            loop.create_task(self.start_fastapi_service(
-                "api.enhanced_runtime_api:app",
-                settings.api_host,
-                settings.api_port
-            )),
-            loop.create_task(self.start_fastapi_service(
-                "mcp_server.server:MCPServer().app",
-                settings.mcp_server_host,
-                settings.mcp_server_port
-            ))
-        ]
-        
-        # Handle shutdown gracefully
-        def signal_handler(signum, frame):
-            logger.info(f"Received signal {signum}, shutting down...")
-            self.shutdown_all_services()
-            for task in tasks:
-                task.cancel()
-            loop.stop()
-        
-        signal.signal(signal.SIGINT, signal_handler)
-        signal.signal(signal.SIGTERM, signal_handler)
+        # All agents boot in parallel, so the waits overlap too
+        ready = await asyncio.gather(*(self.wait_for_port(port, process) for _, port, process in started))
+        for (agent_name, port, process), ok in zip(started, ready):
+            if process.returncode is not None:
+                logger.error(f"{agent_name} exited with code {process.returncode} during startup")
+            elif not ok:
+                logger.warning(f"{agent_name} is not accepting connections on port {port} yet")
+    
+    async def run_services(self):
+        """Initialize the database, start the agents and serve the APIs on one event loop."""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.shutdown_event.set)
         
         try:
-            # Run the event loop
-            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            # Schema creation overlaps with the agents booting
+            logger.info("Initializing database...")
+            await asyncio.gather(init_db(), self.start_agents())
+            
+            servers = asyncio.gather(
+                self.start_fastapi_service(
+                    "api.enhanced_runtime_api:app",
+                    settings.api_host,
+                    settings.api_port
+                ),
+                self.start_fastapi_service(
+                    "mcp_server.server:MCPServer().app",
+                    settings.mcp_server_host,
+                    settings.mcp_server_port
+                ),
+                return_exceptions=True
+            )
+            shutdown = asyncio.ensure_future(self.shutdown_event.wait())
+            await asyncio.wait({servers, shutdown}, return_when=asyncio.FIRST_COMPLETED)
+            if shutdown.done():
+                logger.info("Received shutdown signal, shutting down...")
+            servers.cancel()
+            shutdown.cancel()
+            await asyncio.gather(servers, return_exceptions=True)
+        finally:
+            await self.shutdown_all_services()
+            await close_db()
+    
+    def start_all_services(self):
+        """Start all services."""
+        logger.info("Starting all services...")
+        try:
+            # The servers share this loop, so use uvloop here as uvicorn.run would on its own
+            with asyncio.Runner(loop_factory=uvloop.new_event_loop if uvloop else None) as runner:
+                runner.run(self.run_services())
         except KeyboardInterrupt:
             logger.info("Received keyboard interrupt")
-        finally:
-            self.shutdown_all_services()
-            loop.close()
     
-    def shutdown_all_services(self):
+    async def shutdown_all_services(self):
         """Shutdown all services gracefully."""
         logger.info("Shutting down all services...")
         
-        for process in self.processes:
-            if process.poll() is None:  # Process is still running
+        async def stop(process: asyncio.subprocess.Process):
+            if process.returncode is None:  # Process is still running
                 logger.info(f"Terminating process {process.pid}")
                 process.terminate()
                 try:
-                    process.wait(timeout=10)
-                except subprocess.TimeoutExpired:
+                    await asyncio.wait_for(process.wait(), timeout=10)
+                except asyncio.TimeoutError:
                     logger.warning(f"Force killing process {process.pid}")
                     process.kill()
+                    await process.wait()
+        
+        await asyncio.gather(*(stop(process) for process in self.processes), return_exceptions=True)
         
         self.processes.clear()
         logger.info("All services shut down")
     
     def check_service_health(self) -> bool:
         """Check if all services are healthy."""
-        import requests
-        
         endpoints = [
             f"http://localhost:5001/health",  # Hello agent
             f"http://localhost:5002/health",  # Goodbye agent  
@@ -165,17 +210,21 @@ class ServiceManager:
             f"http://localhost:{settings.mcp_server_port}/health",  # MCP server
         ]
         
-        for endpoint in endpoints:
-            try:
-                response = requests.get(endpoint, timeout=5)
-                if response.status_code != 200:
-                    logger.warning(f"Service {endpoint} returned {response.status_code}")
-                    return False
-            except Exception as e:
-                logger.warning(f"Service {endpoint} health check failed: {e}")
-                return False
+        # Probe every service at once so the check takes the slowest response, not the sum
+        async def probe_all():
+            async with httpx.AsyncClient(timeout=5) as client:
+                return await asyncio.gather(*(client.get(endpoint) for endpoint in endpoints), return_exceptions=True)
+        
+        healthy = True
+        for endpoint, result in zip(endpoints, asyncio.run(probe_all())):
+            if isinstance(result, Exception):
+                logger.warning(f"Service {endpoint} health check failed: {result}")
+                healthy = False
+            elif result.status_code != 200:
+                logger.warning(f"Service {endpoint} returned {result.status_code}")
+                healthy = False
         
-        return True
+        return healthy
 
 
 def run_single_service(service_name: str):
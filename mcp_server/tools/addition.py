@@ -2,7 +2,7 @@
 Addition tool implementation for the Math MCP server.
 """
 
-async def add(a: float, b: float) -> float:
+def add(a: float, b: float) -> float:
     """
     Add two numbers together.
     
@@ -13,4 +13,4 @@ async def add(a: float, b: float) -> float:
     Returns:
         The sum of the two numbers
     """
-    return float(a) + float(b)
\ No newline at end of file
+    return a + b
\ No newline at end of file
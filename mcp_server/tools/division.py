@@ -2,7 +2,7 @@
 Division tool implementation for the Math MCP server.
 """
 
-async def divide(a: float, b: float) -> float:
+def divide(a: float, b: float) -> float:
     """
     Divide the first number by the second.
     
@@ -16,7 +16,7 @@ async def divide(a: float, b: float) -> float:
     Raises:
         ValueError: If dividing by zero
     """
-    if float(b) == 0:
+    if b == 0:
         raise ValueError("Cannot divide by zero.")
     
-    return float(a) / float(b)
\ No newline at end of file
+    return a / b
\ No newline at end of file
@@ -4,7 +4,7 @@ Logarithm tool implementation for the Math MCP server.
 
 import math
 
-async def log(x: float, base: float = math.e) -> float:
+def log(x: float, base: float = math.e) -> float:
     """
     Calculate the logarithm of a number with an optional base.
     
@@ -18,9 +18,6 @@ async def log(x: float, base: float = math.e) -> float:
     Raises:
         ValueError: If x is non-positive or base is invalid
     """
-    x = float(x)
-    base = float(base)
-    
     if x <= 0:
         raise ValueError("Cannot calculate logarithm of a non-positive number.")
     if base <= 0 or base == 1:
@@ -28,5 +25,8 @@ async def log(x: float, base: float = math.e) -> float:
     
     if base == math.e:
         return math.log(x)  # Natural logarithm
-    else:
-        return math.log(x, base)  # Logarithm with custom base
\ No newline at end of file
+    if base == 2:
+        return math.log2(x)
+    if base == 10:
+        return math.log10(x)
+    return math.log(x) / math.log(base)  # Logarithm with custom base
\ No newline at end of file
@@ -2,7 +2,9 @@
 Modulo and modular arithmetic tools for the Math MCP server.
 """
 
-async def modulo(a: int, b: int) -> int:
+from functools import lru_cache
+
+def modulo(a: int, b: int) -> int:
     """
     Find the remainder of division of one number by another.
     
@@ -16,12 +18,12 @@ async def modulo(a: int, b: int) -> int:
     Raises:
         ValueError: If dividing by zero
     """
-    if int(b) == 0:
+    if b == 0:
         raise ValueError("Cannot modulo by zero.")
     
-    return int(a) % int(b)
+    return a % b
 
-async def modular_inverse(a: int, m: int) -> int:
+def modular_inverse(a: int, m: int) -> int:
     """
     Find the modular inverse of a number modulo another number.
     
@@ -35,15 +37,18 @@ async def modular_inverse(a: int, m: int) -> int:
     Raises:
         ValueError: If no modular inverse exists
     """
-    a = int(a)
-    m = int(m)
+    if m <= 1:
+        raise ValueError(f"No modular inverse exists for {a} mod {m}.")
     
     # Ensure a is within modulo range
     a = a % m
     
-    # Brute force search for modular inverse
-    for x in range(1, m):
-        if (a * x) % m == 1:
-            return x
-    
-    raise ValueError(f"No modular inverse exists for {a} mod {m}.")
\ No newline at end of file
+    try:
+        return _modinv(a, m)
+    except ValueError:
+        raise ValueError(f"No modular inverse exists for {a} mod {m}.") from None
+
+@lru_cache(maxsize=4096)
+def _modinv(a: int, m: int) -> int:
+    # pow with exponent -1 runs the extended Euclidean algorithm in O(log m)
+    return pow(a, -1, m)
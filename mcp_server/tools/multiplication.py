@@ -2,7 +2,7 @@
 Multiplication tool implementation for the Math MCP server.
 """
 
-async def multiply(a: float, b: float) -> float:
+def multiply(a: float, b: float) -> float:
     """
     Multiply two numbers together.
     
@@ -13,4 +13,4 @@ async def multiply(a: float, b: float) -> float:
     Returns:
         The product of the two numbers
     """
-    return float(a) * float(b)
\ No newline at end of file
+    return a * b
\ No newline at end of file
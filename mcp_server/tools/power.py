@@ -2,7 +2,7 @@
 Power/exponentiation tool implementation for the Math MCP server.
 """
 
-async def power(base: float, exponent: float) -> float:
+def power(base: float, exponent: float) -> float:
     """
     Raise a number to the power of another.
     
@@ -13,4 +13,4 @@ async def power(base: float, exponent: float) -> float:
     Returns:
         The result of the exponentiation
     """
-    return float(base) ** float(exponent)
\ No newline at end of file
+    return base ** exponent
\ No newline at end of file
@@ -4,7 +4,7 @@ Square root tool implementation for the Math MCP server.
 
 import math
 
-async def square_root(x: float) -> float:
+def square_root(x: float) -> float:
     """
     Calculate the square root of a number.
     
@@ -17,7 +17,6 @@ async def square_root(x: float) -> float:
     Raises:
         ValueError: If the number is negative
     """
-    x = float(x)
     if x < 0:
         raise ValueError("Cannot calculate square root of a negative number.")
     
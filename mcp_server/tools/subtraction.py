@@ -2,7 +2,7 @@
 Subtraction tool implementation for the Math MCP server.
 """
 
-async def subtract(a: float, b: float) -> float:
+def subtract(a: float, b: float) -> float:
     """
     Subtract the second number from the first.
     
@@ -13,4 +13,4 @@ async def subtract(a: float, b: float) -> float:
     Returns:
         The difference between the two numbers
     """
-    return float(a) - float(b)
\ No newline at end of file
+    return a - b
\ No newline at end of file
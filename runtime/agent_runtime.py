@@ -1,20 +1,27 @@
 #!/usr/bin/env python3
 
 import asyncio
+import contextvars
 import datetime
-import json
+import functools
 import logging
 import os
+import secrets
 import time
 import uuid
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-import aiohttp
+import httpx
+import orjson
 import semantic_kernel as sk
 from semantic_kernel.connectors.ai.function_choice_behavior import FunctionChoiceBehavior
 from semantic_kernel.connectors.ai.open_ai import OpenAIChatCompletion
 from semantic_kernel.connectors.ai.prompt_execution_settings import PromptExecutionSettings
 from semantic_kernel.contents.chat_history import ChatHistory
+from semantic_kernel.contents.function_call_content import FunctionCallContent
 from semantic_kernel.functions.kernel_function_decorator import kernel_function
 
 # Configure logging
@@ -29,46 +36,170 @@ DEBUG = os.environ.get("AGENT_RUNTIME_DEBUG", "false").lower() == "true"
 print(f"Agent Runtime DEBUG mode: {DEBUG}, env var: {os.environ.get('AGENT_RUNTIME_DEBUG', 'not set')}")
 
 
-def debug_print(message: str):
-    """Print debug messages only if DEBUG is True."""
+def debug_print(fmt: str, *args: Any):
+    """Print debug messages only if DEBUG is True, formatting them only then."""
     if DEBUG:
-        print(message)
+        print(fmt % args if args else fmt)
 
 
-# Track the last called agent
-last_called_agent = None
-last_agent_response = None  # Added to track the agent response for streaming
+# Last formatted UTC timestamp, reused while the second hasn't changed
+_timestamp_cache = [0, ""]
+
+
+def utc_timestamp() -> str:
+    """Return the current UTC time as an ISO 8601 string with a Z suffix."""
+    now = int(time.time())
+    if now != _timestamp_cache[0]:
+        _timestamp_cache[:] = [now, time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now))]
+    return _timestamp_cache[1]
+
+
+def extract_response_text(result: Any) -> str:
+    """Pull the reply text out of a chat completion result, whichever shape it came back in."""
+    if isinstance(result, list):
+        if not result:
+            return str(result)
+        # A list of messages: prefer the first message's first text item
+        message = result[0]
+        try:
+            return message.items[0].text
+        except (AttributeError, IndexError):
+            pass
+        try:
+            return message.content
+        except AttributeError:
+            return str(message)
+
+    try:
+        return result.content
+    except AttributeError:
+        pass
+    try:
+        return result.items[0].text
+    except (AttributeError, IndexError):
+        return str(result)
+
+
+def _plugin_registrar() -> Callable[[sk.Kernel, Any, str], Any]:
+    """Pick the plugin registration call this Semantic Kernel version provides."""
+    if hasattr(sk.Kernel, "add_plugin"):
+        return lambda kernel, plugin, name: kernel.add_plugin(plugin, plugin_name=name)
+    if hasattr(sk.Kernel, "register_plugin"):
+        return lambda kernel, plugin, name: kernel.register_plugin(plugin, plugin_name=name)
+    return lambda kernel, plugin, name: kernel.plugins.add_from_object(plugin, name)
+
+
+# Resolved once at import rather than discovered by trial and error per agent
+register_plugin = _plugin_registrar()
+
+
+def normalize_query(query: str) -> str:
+    """Reduce a query to the form used as a routing plan cache key."""
+    return " ".join(query.lower().split())
+
+
+def agent_calls(messages: List[Any]) -> List[Tuple[str, str]]:
+    """List the (agent_id, query) pairs of the call_agent invocations in chat messages."""
+    calls = []
+    for message in messages:
+        for item in message.items:
+            if isinstance(item, FunctionCallContent) and item.function_name == "call_agent":
+                arguments = item.parse_arguments() or {}
+                calls.append((item.plugin_name.replace('_', '-'), arguments.get("query", "")))
+    return calls
+
+
+# In-memory conversations kept per runtime; older ones are dropped (the enhanced runtime
+# keeps the full history in the database)
+MAX_CONVERSATIONS = int(os.environ.get("AGENT_RUNTIME_MAX_CONVERSATIONS", "1024"))
+
+# Opening queries whose agent calls are remembered and replayed without the chat model
+PLAN_CACHE_SIZE = 256
+
+
+# System prompt for the orchestrating chat model, shared by the plain and streaming paths
+ORCHESTRATOR_SYSTEM_PROMPT = """
+You are an intelligent orchestrator that coordinates between human users and specialized agent functions. Your primary responsibilities are:
+
+1. COORDINATION: Analyze user queries to determine if they require specialized agent capabilities: look at what agents you have access to and determine which one is the best fit for the user's question or if you should answer directly
+2. DETAILED COMMUNICATION: When calling an agent, provide the FULL CONTEXT of the user's question, not just isolated formulas or parts
+3. PROBLEM DESCRIPTION: Describe the complete problem to the agent, including all relevant details the user provided
+4. CLARITY: Frame queries to agents as requests for help solving a specific problem, not as commands to perform operations
+5. INTERACTION: If a user query is ambiguous or lacks necessary details, ask follow-up questions to clarify before proceeding
+6. CONSOLIDATION: Integrate agent responses into a coherent answer without unnecessary repetition
+
+IMPORTANT GUIDELINES:
+- When calling specialized agents like the math agent, frame requests as "The user wants to solve [complete problem]. Can you help with this?"
+- Allow agents to break down problems themselves rather than pre-fragmenting tasks
+- For each agent call, share the complete context and details from the user's question
+- Let agents determine their own approach to solving problems within their domain
+- Keep your final responses to users concise and focused on the answer, not the process
+- In final responses to users, don't repeat the agent's full chain of reasoning unless specifically requested
+- If you want to know more about what an agent can do, you are allowed to first ask the agent to describe its capabilities
+"""
+
+# Queued after a streamed query's last event to end the stream
+EVENTS_DONE = object()
+
+@dataclass(slots=True)
+class ContentChunk:
+    """A piece of streamed model text; orjson encodes it as {"content": ...} like a dict would."""
+    content: str
+
+
+# Message ids only need to be unique, not RFC 4122 formatted
+new_message_id = functools.partial(secrets.token_hex, 16)
+
+# Event queue of the streamed query running in the current task, if any. Each stream
+# gets its own, so concurrent streams never see each other's events.
+current_event_queue: contextvars.ContextVar[Optional[asyncio.Queue]] = contextvars.ContextVar(
+    "current_event_queue", default=None
+)
+
+
+def create_streaming_task(coro, event_queue: asyncio.Queue) -> asyncio.Task:
+    """Run coro as a task whose agent calls and chunks are reported to event_queue."""
+    context = contextvars.copy_context()
+    context.run(current_event_queue.set, event_queue)
+    # create_task copies the context it is called in, so the task inherits the queue
+    return context.run(asyncio.create_task, coro)
+
+
+# Ids of the agents called by the streamed query running in the current task. The list
+# is created per query and only appended to, so function calls the kernel runs in child
+# tasks (which get a copy of the context) still record into the same list.
+called_agents: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar(
+    "called_agents", default=None
+)
 
 
 class AgentPlugin:
     """A plugin that represents an agent in the Semantic Kernel."""
 
-    def __init__(self, agent_config: Dict[str, Any]):
+    def __init__(self, agent_config: Dict[str, Any], http_client: Callable[[], httpx.AsyncClient]):
         self.id = agent_config["id"]
         self.name = agent_config["name"]
         self.endpoint = agent_config["endpoint"]
         self.description = agent_config.get("description", f"Call the {self.name} agent")
         self.capabilities = agent_config.get("capabilities", [])
         self.conversation_starters = agent_config.get("conversation_starters", [])
+        # Handle special message types based on agent ID
+        # This is an implementation detail that could be moved to agent config
+        self._msg_type = 0 if self.id == "goodbye-agent" else "Text"
+        # Returns the runtime's pooled HTTP client, shared by every agent
+        self._http_client = http_client
         logger.debug(f"Initialized AgentPlugin: {self.id} with endpoint {self.endpoint}")
 
     def generate_request(self, content: str, sender_id: str, conversation_id: Optional[str] = None) -> Dict[str, Any]:
         """Generate a request to the agent."""
-        if conversation_id is None:
-            conversation_id = str(uuid.uuid4())
-
-        # Handle special message types based on agent ID
-        # This is an implementation detail that could be moved to agent config
-        msg_type = 0 if self.id == "goodbye-agent" else "Text"
-
         return {
-            "messageId": str(uuid.uuid4()),
-            "conversationId": conversation_id,
+            "messageId": new_message_id(),
+            "conversationId": conversation_id or uuid.uuid4().hex,
             "senderId": sender_id,
             "recipientId": self.id,
             "content": content,
-            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-            "type": msg_type
+            "timestamp": utc_timestamp(),
+            "type": self._msg_type
         }
 
     @kernel_function(
@@ -82,48 +213,49 @@ class AgentPlugin:
         conversation_id: str = None
     ) -> str:
         """Call the agent with the given query."""
-        global last_called_agent
-        global last_agent_response
-
-        # Track this agent call
-        last_called_agent = self.id
-        last_agent_response = None  # Reset the response
+        # Track this agent call for the query that made it
+        agents = called_agents.get()
+        if agents is not None and self.id not in agents:
+            agents.append(self.id)
 
         # Emit an agent_call event immediately (for streaming clients)
         # Skip the direct print to avoid duplicated output
-        if hasattr(self, '_event_queue') and self._event_queue is not None:
-            await self._event_queue.put({
+        event_queue = current_event_queue.get()
+        if event_queue is not None:
+            event_queue.put_nowait({
                 "agent_call": self.id,
-                "agent_query": query  # Include the query being sent to the agent
+                "agent_query": query,  # Include the query being sent to the agent
+                "priority": True  # The APIs flush pending SSE frames with this one rather than batching it
             })
 
         logger.debug(f"Calling agent {self.id} with query: {query}")
         try:
             request = self.generate_request(query, sender_id, conversation_id)
 
-            async with aiohttp.ClientSession() as session:
-                logger.debug(f"Sending request to {self.endpoint}")
-                async with session.post(self.endpoint, json=request) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        response_content = result.get("content", "No response from agent")
-                        logger.debug(f"Received response from {self.id}: {response_content[:50]}...")
-
-                        # Store the response for streaming
-                        last_agent_response = response_content
-
-                        # Emit the agent response event immediately (for streaming clients)
-                        if hasattr(self, '_event_queue') and self._event_queue is not None:
-                            await self._event_queue.put({
-                                "agent_id": self.id,
-                                "agent_response": response_content
-                            })
-
-                        return response_content
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Error calling agent {self.id}: {response.status} - {error_text}")
-                        return f"Error calling agent: {response.status}"
+            client = self._http_client()
+            logger.debug(f"Sending request to {self.endpoint}")
+            response = await client.post(
+                self.endpoint,
+                content=orjson.dumps(request),
+                headers={"Content-Type": "application/json"}
+            )
+            if response.status_code == 200:
+                result = orjson.loads(response.content)
+                response_content = result.get("content", "No response from agent")
+                logger.debug(f"Received response from {self.id}: {response_content[:50]}...")
+
+                # Emit the agent response event immediately (for streaming clients)
+                if event_queue is not None:
+                    event_queue.put_nowait({
+                        "agent_id": self.id,
+                        "agent_response": response_content,
+                        "priority": True
+                    })
+
+                return response_content
+            else:
+                logger.error(f"Error calling agent {self.id}: {response.status_code} - {response.text}")
+                return f"Error calling agent: {response.status_code}"
         except Exception as e:
             logger.error(f"Exception calling agent {self.id}: {e}")
             return f"Exception calling agent: {str(e)}"
@@ -152,60 +284,87 @@ class AgentGroupChat:
     async def process_query(self, query: str, user_id: str = "user", conversation_id: Optional[str] = None, verbose: bool = False) -> Dict[str, Any]:
         """Process a user query through agent conversation."""
         if not conversation_id:
-            conversation_id = str(uuid.uuid4())
+            conversation_id = uuid.uuid4().hex
 
         # Add user message to conversation
         user_message = {
             "role": "user",
             "content": query,
-            "timestamp": datetime.datetime.now().isoformat()
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()
         }
         self.messages.append(user_message)
 
         # Set up execution trace if verbose
         execution_trace = []
 
-        # Call agents and collect responses
-        responses = []
-        for agent in self.agents:
-            # Add to execution trace before calling
+        # Agents are independent, so call them all at once
+        async def call(agent: AgentPlugin) -> str:
+            response_content = await agent.call_agent(query, user_id, conversation_id)
+            # Add to execution trace if verbose
             if verbose:
+                print(f"  ↪ {agent.name}: {response_content}")
+            return response_content
+
+        if verbose:
+            for agent in self.agents:
                 trace_entry = f"Calling {agent.name}..."
                 execution_trace.append(trace_entry)
                 print(trace_entry)
 
-            # Call the agent
-            response_content = await agent.call_agent(query, user_id, conversation_id)
+        # Collect responses as they land and stop as soon as the termination strategy is satisfied
+        tasks = [asyncio.ensure_future(call(agent)) for agent in self.agents]
+        finished = set()
+        pending = set(tasks)
+        try:
+            while pending and not self.termination_strategy.should_terminate(len(finished), self.messages):
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                finished |= done
+        finally:
+            # Agents still running once the chat is over are no longer needed
+            for task in pending:
+                task.cancel()
 
-            # Add to execution trace if verbose
-            if verbose:
-                print(f"  ↪ {response_content}")
+        # One timestamp for everything produced by this turn
+        now_iso = datetime.datetime.now(datetime.timezone.utc).isoformat()
 
+        responses = []
+        contents = []
+        for agent, task in zip(self.agents, tasks):
+            if task not in finished:
+                if verbose:
+                    execution_trace.append(f"Skipped {agent.name} (conversation terminated)")
+                continue
+            try:
+                response_content = task.result()
+            except Exception as e:
+                response_content = f"Exception calling agent: {e}"
+
+            contents.append(response_content)
             responses.append({
                 "agent_id": agent.id,
                 "agent_name": agent.name,
                 "response": {
                     "content": response_content,
-                    "messageId": str(uuid.uuid4()),
+                    "messageId": new_message_id(),
                     "conversationId": conversation_id,
                     "senderId": agent.id,
                     "recipientId": user_id,
-                    "timestamp": datetime.datetime.now().isoformat(),
+                    "timestamp": now_iso,
                     "type": "Text"
                 }
             })
 
         # Combine responses
-        combined_content = " ".join([r["response"].get("content", "") for r in responses])
+        combined_content = " ".join(contents)
 
         # Create final message
         final_message = {
-            "messageId": str(uuid.uuid4()),
+            "messageId": new_message_id(),
             "conversationId": conversation_id,
             "senderId": "agent-runtime",
             "recipientId": user_id,
             "content": combined_content,
-            "timestamp": datetime.datetime.now().isoformat(),
+            "timestamp": now_iso,
             "type": "Text",
             "agent_responses": responses,
             "execution_trace": execution_trace if verbose else None
@@ -215,7 +374,7 @@ class AgentGroupChat:
         self.messages.append({
             "role": "assistant",
             "content": combined_content,
-            "timestamp": datetime.datetime.now().isoformat(),
+            "timestamp": now_iso,
             "agent_responses": responses,
             "execution_trace": execution_trace if verbose else None
         })
@@ -232,11 +391,31 @@ class AgentRuntime:
 
     def __init__(self, config_path: str = None):
         self.agents = {}
-        self.conversations = {}
+        # Bumped whenever the agent registry changes so callers can cache derived data
+        self.agents_version = 0
+        # Most recently active conversations last; the oldest are dropped beyond MAX_CONVERSATIONS
+        self.conversations: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        # Chat model history per conversation, extended turn by turn rather than rebuilt
+        self.chat_histories: Dict[str, ChatHistory] = {}
         self.kernel = None
+        # Set once the kernel and agent plugins are set up, however that went
+        self.kernel_ready = asyncio.Event()
         self.verbose = False
         self.enable_streaming = False  # Default to False
-        self.event_queue = None  # Initialize as None, will create when streaming is used
+        # Off by default: a replayed plan returns the agents' raw replies rather than the
+        # model's consolidated answer, and is shared across every user and conversation
+        self.enable_plan_cache = False
+        # Normalized opening query -> the agent calls the chat model chose for it
+        self._plan_cache: "OrderedDict[str, Tuple[Tuple[str, str], ...]]" = OrderedDict()
+        # Normalized opening query -> the chat model answer currently being produced for it
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._http_client: Optional[httpx.AsyncClient] = None
+        # Resolved once in initialize_kernel rather than looked up per query
+        self._chat_service: Optional[OpenAIChatCompletion] = None
+        self._default_settings = PromptExecutionSettings()
+        self._default_settings.function_choice_behavior = FunctionChoiceBehavior.Auto()
+        # Add a note to only use functions when absolutely necessary
+        self._default_settings.extension_data = {"function_call_guidance": "only_when_necessary"}
 
         # If config_path is not provided, use the default path
         if config_path is None:
@@ -247,21 +426,24 @@ class AgentRuntime:
         self.load_config(config_path)
         self.initialize_kernel()
         self.register_agent_plugins()
+        self.kernel_ready.set()
 
     def load_config(self, config_path: str):
         """Load agent configurations from the provided JSON file."""
         try:
-            with open(config_path, "r") as f:
-                config = json.load(f)
+            config = orjson.loads(Path(config_path).read_bytes())
 
             # Load settings if available
             if "settings" in config:
                 settings = config["settings"]
                 self.enable_streaming = settings.get("enable_streaming", False)
+                self.enable_plan_cache = settings.get("enable_plan_cache", False)
 
-            for agent_config in config.get("agents", []):
-                agent_id = agent_config["id"]
-                self.agents[agent_id] = AgentPlugin(agent_config)
+            self.agents = {
+                agent_config["id"]: AgentPlugin(agent_config, self.http_client)
+                for agent_config in config.get("agents", [])
+            }
+            self.agents_version += 1
         except Exception as e:
             print(f"Error loading agent configuration: {e}")
 
@@ -286,6 +468,7 @@ class AgentRuntime:
                     api_key=api_key
                 )
                 self.kernel.add_service(chat_service)
+                self._chat_service = chat_service
                 logger.debug("OpenAI chat service added successfully")
 
                 # Register agent plugins
@@ -303,37 +486,19 @@ class AgentRuntime:
         try:
             # Register each agent as a plugin
             for agent_id, agent in self.agents.items():
-                logger.debug(f"Registering agent {agent_id} as a plugin")
-                logger.debug(f"Agent object: {agent.__dict__}")
+                logger.debug("Registering agent %s as a plugin", agent_id)
+                logger.debug("Agent object: %s", agent.__dict__)
 
                 # Convert agent_id to a valid plugin name (replace hyphens with underscores)
                 plugin_name = agent_id.replace('-', '_')
-                logger.debug(f"Using plugin name: {plugin_name} for agent {agent_id}")
+                logger.debug("Using plugin name: %s for agent %s", plugin_name, agent_id)
 
                 # Log the available methods on the kernel
-                logger.debug(f"Available kernel methods: {dir(self.kernel)}")
-
-                # Try different registration methods based on Semantic Kernel version
-                try:
-                    logger.debug("Trying to register with add_plugin")
-                    self.kernel.add_plugin(agent, plugin_name=plugin_name)
-                    logger.info(f"Registered agent {agent_id} as a plugin using add_plugin")
-                except Exception as e1:
-                    logger.debug(f"add_plugin failed: {e1}")
-                    try:
-                        logger.debug("Trying to register with create_plugin_from_object")
-                        self.kernel.plugins.add_from_object(agent, plugin_name)
-                        logger.info(f"Registered agent {agent_id} as a plugin using create_plugin_from_object")
-                    except Exception as e2:
-                        logger.debug(f"create_plugin_from_object failed: {e2}")
-                        try:
-                            logger.debug("Trying to register with register_plugin")
-                            self.kernel.register_plugin(agent, plugin_name=plugin_name)
-                            logger.info(f"Registered agent {agent_id} as a plugin using register_plugin")
-                        except Exception as e3:
-                            logger.debug(f"register_plugin failed: {e3}")
-                            logger.error(f"All registration methods failed for agent {agent_id}")
-                            raise Exception(f"Could not register agent {agent_id}: {e1}, {e2}, {e3}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Available kernel methods: %s", dir(self.kernel))
+
+                register_plugin(self.kernel, agent, plugin_name)
+                logger.info(f"Registered agent {agent_id} as a plugin")
         except Exception as e:
             logger.error(f"Error registering agent plugins: {e}")
             # Continue without function calling capabilities
@@ -347,125 +512,77 @@ class AgentRuntime:
 
         # Initialize conversation if not provided
         if not conversation_id:
-            conversation_id = str(uuid.uuid4())
+            conversation_id = uuid.uuid4().hex
 
         # Initialize conversation history if it doesn't exist
-        if conversation_id not in self.conversations:
-            self.conversations[conversation_id] = []
+        self.open_conversation(conversation_id)
 
         # Add user message to conversation history
         self.conversations[conversation_id].append({
             "role": "user",
             "content": query,
-            "timestamp": datetime.datetime.now().isoformat()
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()
         })
 
-        # Create a chat history for the conversation
-        chat_history = ChatHistory()
-
-        # Add system message
-        system_message = """
-        You are an intelligent orchestrator that coordinates between human users and specialized agent functions. Your primary responsibilities are:
-
-        1. COORDINATION: Look at what agents you have access to and determine which one is the best fit for the user's question or if you should answer directly
-        2. DETAILED COMMUNICATION: When calling an agent, provide the FULL CONTEXT of the user's question, not just isolated formulas or parts
-        3. PROBLEM DESCRIPTION: Describe the complete problem to the agent, including all relevant details the user provided
-        4. CLARITY: Frame queries to agents as requests for help solving a specific problem, not as commands to perform operations
-        5. INTERACTION: If a user query is ambiguous or lacks necessary details, ask follow-up questions to clarify before proceeding
-        6. CONSOLIDATION: Integrate agent responses into a coherent answer without unnecessary repetition
-
-        IMPORTANT GUIDELINES:
-        - When calling specialized agents like the math agent, frame requests as "The user wants to solve [complete problem]. Can you help with this?"
-        - Allow agents to break down problems themselves rather than pre-fragmenting tasks
-        - For each agent call, share the complete context and details from the user's question
-        - Let agents determine their own approach to solving problems within their domain
-        - Keep your final responses to users concise and focused on the answer, not the process
-        - In final responses to users, don't repeat the agent's full chain of reasoning unless specifically requested
-        """
-        chat_history.add_system_message(system_message)
-
-        # Add conversation history
-        for message in self.conversations[conversation_id]:
-            if message["role"] == "user":
-                chat_history.add_user_message(message["content"])
-            elif message["role"] == "assistant":
-                chat_history.add_assistant_message(message["content"])
+        # Get the chat history for the conversation, now ending with this query
+        chat_history = self.get_chat_history(conversation_id, query)
 
         # Track which agents were used
         agents_used = []
         execution_trace = []
 
-        try:
-            # Get the chat service
-            chat_service = self.kernel.get_service("chat-gpt")
-
-            # Set up function calling behavior
-            settings = PromptExecutionSettings()
-            settings.function_choice_behavior = FunctionChoiceBehavior.Auto()
-
-            # Add a note to only use functions when absolutely necessary
-            settings.extension_data = {"function_call_guidance": "only_when_necessary"}
-
-            print("Using Semantic Kernel for function calling")
-
-            # Process the query with function calling
-            result = await chat_service.get_chat_message_contents(
-                chat_history=chat_history,
-                settings=settings,
-                kernel=self.kernel
-            )
-
-            # Extract the response content
-            # Handle different result formats
-            if hasattr(result, 'content'):
-                response_content = result.content
-            elif hasattr(result, 'items') and len(result.items) > 0 and hasattr(result.items[0], 'text'):
-                response_content = result.items[0].text
-            elif isinstance(result, list) and len(result) > 0:
-                if hasattr(result[0], 'items') and len(result[0].items) > 0 and hasattr(result[0].items[0], 'text'):
-                    response_content = result[0].items[0].text
-                elif hasattr(result[0], 'content'):
-                    response_content = result[0].content
-                else:
-                    response_content = str(result[0])
-            else:
-                response_content = str(result)
-
-            logger.debug(f"Extracted response content: {response_content[:50]}...")
-
-            # Check if any function calls were made
-            function_calls = []
-            if hasattr(result, 'function_calls'):
-                function_calls = result.function_calls
-            elif isinstance(result, list) and len(result) > 0 and hasattr(result[0], 'function_calls'):
-                function_calls = result[0].function_calls
+        # Only opening queries are routed from the cache or shared between concurrent callers;
+        # later turns depend on the conversation
+        plan_key = normalize_query(query) if self.enable_plan_cache and len(chat_history.messages) == 2 else None
+        plan = self._plan_cache.get(plan_key) if plan_key else None
+        if plan and not all(agent_id in self.agents for agent_id, _ in plan):
+            plan = None
 
-            if function_calls:
-                for function_call in function_calls:
-                    function_name = function_call.name
-                    agent_id = function_name.split('-')[0].replace('_', '-')
+        try:
+            if plan:
+                # Seen this query before: replay its agent calls concurrently and skip the chat model
+                self._plan_cache.move_to_end(plan_key)
+                responses = await asyncio.gather(*(
+                    self.agents[agent_id].call_agent(agent_query, conversation_id=conversation_id)
+                    for agent_id, agent_query in plan
+                ))
+                response_content = "\n\n".join(responses)
+                for agent_id, agent_query in plan:
                     agents_used.append(agent_id)
-                    execution_trace.append(f"Called {agent_id} with query: {query}")
-                    logger.debug(f"Function call: {function_name} with args: {function_call.arguments}")
-
-            # Create the response message
+                    execution_trace.append(f"Called {agent_id} with query: {agent_query} (cached plan)")
+            elif plan_key in self._inflight:
+                # An identical opening query is already with the chat model; share its answer
+                response_content, shared_agents, shared_trace = await asyncio.shield(self._inflight[plan_key])
+                agents_used.extend(shared_agents)
+                execution_trace.extend(shared_trace)
+            else:
+                task = asyncio.ensure_future(self._answer_with_chat_model(chat_history, query, plan_key))
+                if plan_key:
+                    self._inflight[plan_key] = task
+                    task.add_done_callback(lambda _: self._inflight.pop(plan_key, None))
+                # Shielded so a cancelled caller doesn't cancel the answer other callers are waiting on
+                response_content, agents_used, execution_trace = await asyncio.shield(task)
+
+            # Create the response message, stamped once for both copies
+            now_iso = datetime.datetime.now(datetime.timezone.utc).isoformat()
             response_message = {
-                "messageId": str(uuid.uuid4()),
+                "messageId": new_message_id(),
                 "conversationId": conversation_id,
                 "senderId": "runtime",
                 "recipientId": "user",
                 "content": response_content,
-                "timestamp": datetime.datetime.now().isoformat(),
+                "timestamp": now_iso,
                 "type": "Text",
                 "execution_trace": execution_trace if verbose else [],
                 "agents_used": agents_used  # Always include agents_used
             }
 
             # Add to conversation history
+            chat_history.add_assistant_message(response_content)
             self.conversations[conversation_id].append({
                 "role": "assistant",
                 "content": response_content,
-                "timestamp": datetime.datetime.now().isoformat(),
+                "timestamp": now_iso,
                 "execution_trace": execution_trace if verbose else [],
                 "agents_used": agents_used  # Always include agents_used
             })
@@ -480,18 +597,134 @@ class AgentRuntime:
 
             # Create an error response message
             response_message = {
-                "messageId": str(uuid.uuid4()),
+                "messageId": new_message_id(),
                 "conversationId": conversation_id,
                 "senderId": "runtime",
                 "recipientId": "user",
                 "content": error_message,
-                "timestamp": datetime.datetime.now().isoformat(),
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
                 "type": "Text",
                 "error": str(e)
             }
 
             return response_message
 
+    async def _answer_with_chat_model(
+        self,
+        chat_history: ChatHistory,
+        query: str,
+        plan_key: Optional[str]
+    ) -> Tuple[str, List[str], List[str]]:
+        """Answer the query with the chat model, returning (response, agents_used, execution_trace)."""
+        agents_used = []
+        execution_trace = []
+
+        # Get the chat service and function calling settings resolved at kernel setup
+        chat_service = self._chat_service
+        if chat_service is None:
+            raise RuntimeError("Chat service not available")
+        settings = self._default_settings
+
+        print("Using Semantic Kernel for function calling")
+
+        # Process the query with function calling
+        turn_start = len(chat_history.messages)
+        result = await chat_service.get_chat_message_contents(
+            chat_history=chat_history,
+            settings=settings,
+            kernel=self.kernel
+        )
+
+        # Extract the response content
+        response_content = extract_response_text(result)
+
+        logger.debug(f"Extracted response content: {response_content[:50]}...")
+
+        # Check if any function calls were made
+        function_calls = getattr(result, "function_calls", None) or (
+            getattr(result[0], "function_calls", None) if isinstance(result, list) and result else None
+        ) or []
+
+        if function_calls:
+            for function_call in function_calls:
+                function_name = function_call.name
+                agent_id = function_name.split('-')[0].replace('_', '-')
+                agents_used.append(agent_id)
+                execution_trace.append(f"Called {agent_id} with query: {query}")
+                logger.debug(f"Function call: {function_name} with args: {function_call.arguments}")
+
+        # Auto-invoked calls are recorded in the chat history; remember them for a repeat
+        calls = agent_calls(chat_history.messages[turn_start:])
+        if not agents_used:
+            agents_used.extend(agent_id for agent_id, _ in calls)
+        if plan_key and calls:
+            self._plan_cache[plan_key] = tuple(calls)
+            if len(self._plan_cache) > PLAN_CACHE_SIZE:
+                self._plan_cache.popitem(last=False)
+
+        return response_content, agents_used, execution_trace
+
+    async def initialize(self):
+        """Finish runtime bootstrap before the first request is served.
+
+        Waits for kernel setup (signalled by kernel_ready), then reports the outcome.
+        """
+        await self.kernel_ready.wait()
+        if self.kernel is None:
+            logger.warning("Runtime initialized without a Semantic Kernel instance")
+        logger.info(f"Agent runtime ready with {len(self.agents)} agents")
+
+    def http_client(self) -> httpx.AsyncClient:
+        """Return the pooled HTTP client for agent calls, creating it on first use.
+
+        HTTP/2 lets concurrent calls to agents behind the same TLS ingress share one
+        connection; plain-HTTP agents keep using pooled HTTP/1.1 keep-alive connections.
+        """
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=30),
+                timeout=30.0
+            )
+        return self._http_client
+
+    async def aclose(self):
+        """Close the pooled HTTP client."""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    def open_conversation(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Return the conversation's message list, creating it and evicting the least recently used."""
+        messages = self.conversations.get(conversation_id)
+        if messages is not None:
+            self.conversations.move_to_end(conversation_id)
+            return messages
+
+        messages = self.conversations[conversation_id] = []
+        while len(self.conversations) > MAX_CONVERSATIONS:
+            evicted_id, _ = self.conversations.popitem(last=False)
+            self.chat_histories.pop(evicted_id, None)
+        return messages
+
+    def get_chat_history(self, conversation_id: str, query: str) -> ChatHistory:
+        """Return the conversation's chat history with the new user query appended."""
+        chat_history = self.chat_histories.get(conversation_id)
+        if chat_history is not None:
+            chat_history.add_user_message(query)
+            return chat_history
+
+        # First time through: seed from the recorded turns, which already include this query
+        chat_history = ChatHistory()
+        chat_history.add_system_message(ORCHESTRATOR_SYSTEM_PROMPT)
+        role_adders = {"user": chat_history.add_user_message, "assistant": chat_history.add_assistant_message}
+        for message in self.conversations.get(conversation_id, []):
+            add_message = role_adders.get(message["role"])
+            if add_message is not None:
+                add_message(message["content"])
+        self.chat_histories[conversation_id] = chat_history
+        return chat_history
+
     def get_conversation_history(self, conversation_id: str) -> List[Dict[str, Any]]:
         """Get the conversation history for a specific conversation."""
         if conversation_id in self.conversations:
@@ -508,116 +741,71 @@ class AgentRuntime:
 
     async def stream_process_query(self, query: str, conversation_id: Optional[str] = None, verbose: bool = False):
         """Stream the processing of a query, yielding chunks of the response."""
-        debug_print(f"DEBUG: stream_process_query called with query: {query}, conversation_id: {conversation_id}")
+        debug_print("DEBUG: stream_process_query called with query: %s, conversation_id: %s", query, conversation_id)
         start_time = time.time()
 
         # Create an event queue for this streaming session
-        self.event_queue = asyncio.Queue()
+        event_queue = asyncio.Queue()
         self._query_processed = False
 
-        # Set event queue on agents temporarily
-        for agent in self.agents.values():
-            agent._event_queue = self.event_queue
-
         # Initialize conversation if not provided
         if not conversation_id:
-            conversation_id = str(uuid.uuid4())
-            debug_print(f"DEBUG: Generated new conversation_id: {conversation_id}")
+            conversation_id = uuid.uuid4().hex
+            debug_print("DEBUG: Generated new conversation_id: %s", conversation_id)
 
         # Initialize conversation dictionary if it doesn't exist
-        if conversation_id not in self.conversations:
-            debug_print(f"DEBUG: Initializing new conversation dictionary for {conversation_id}")
-            self.conversations[conversation_id] = []
+        self.open_conversation(conversation_id)
 
         # Add user query to conversation history
-        debug_print(f"DEBUG: Adding user query to conversation history for {conversation_id}")
+        debug_print("DEBUG: Adding user query to conversation history for %s", conversation_id)
         self.conversations[conversation_id].append({
             "role": "user",
             "content": query,
-            "timestamp": datetime.datetime.now().isoformat()
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()
         })
 
         # Create a background task to process the query
-        query_task = asyncio.create_task(self._process_query_with_events(query, conversation_id, verbose))
+        query_task = create_streaming_task(self._process_query_with_events(query, conversation_id, verbose), event_queue)
+        # Wake the consumer once the query finishes, however it ends
+        query_task.add_done_callback(lambda _: event_queue.put_nowait(EVENTS_DONE))
+
+        # Yield the events from the queue as they arrive, blocking until the next one or the end marker
+        while True:
+            event = await event_queue.get()
+            if event is EVENTS_DONE:
+                break
+            debug_print("DEBUG: Yielding event: %s", event)
+            yield event
+            event_queue.task_done()
+
+        # Get the result from the query task
+        result = query_task.result()
+        if result:
+            debug_print("DEBUG: Query task complete with result: %s", result)
+            yield result
 
-        # Yield the events from the queue as they arrive
-        while not query_task.done() or not self.event_queue.empty():
-            try:
-                # Try to get an event from the queue with a small timeout
-                event = await asyncio.wait_for(self.event_queue.get(), 0.1)
-                debug_print(f"DEBUG: Yielding event: {event}")
-                yield event
-                self.event_queue.task_done()
-            except asyncio.TimeoutError:
-                # No event available, check if query task is done
-                if query_task.done():
-                    # Get the result from the query task
-                    result = query_task.result()
-                    if result:
-                        debug_print(f"DEBUG: Query task complete with result: {result}")
-                        yield result
-                    break
-
-        # Cleanup
-        for agent in self.agents.values():
-            agent._event_queue = None
         self._query_processed = True
-        debug_print(f"DEBUG: Stream processing complete in {time.time() - start_time:.2f}s")
+        debug_print("DEBUG: Stream processing complete in %.2fs", time.time() - start_time)
 
     async def _process_query_with_events(self, query: str, conversation_id: Optional[str] = None, verbose: bool = False):
         """Process a query and emit events along the way."""
-        debug_print(f"DEBUG: _process_query_with_events called with query: {query}, conversation_id: {conversation_id}")
+        debug_print("DEBUG: _process_query_with_events called with query: %s, conversation_id: %s", query, conversation_id)
         start_time = time.time()
+        # This runs in its own task, so the list is private to this query
+        called_agents.set([])
 
         # Try to use Semantic Kernel for function calling if available
         try:
             if self.kernel:
-                # Create a chat history for this conversation
-                debug_print("DEBUG: Creating chat history for conversation")
-                chat_history = ChatHistory()
-
-                # Add system message
-                system_message = """
-                You are an intelligent orchestrator that coordinates between human users and specialized agent functions. Your primary responsibilities are:
-
-                1. COORDINATION: Analyze user queries to determine if they require specialized agent capabilities
-                2. DETAILED COMMUNICATION: When calling an agent, provide the FULL CONTEXT of the user's question, not just isolated formulas or parts
-                3. PROBLEM DESCRIPTION: Describe the complete problem to the agent, including all relevant details the user provided
-                4. CLARITY: Frame queries to agents as requests for help solving a specific problem, not as commands to perform operations
-                5. INTERACTION: If a user query is ambiguous or lacks necessary details, ask follow-up questions to clarify before proceeding
-                6. CONSOLIDATION: Integrate agent responses into a coherent answer without unnecessary repetition
-
-                IMPORTANT GUIDELINES:
-                - When calling specialized agents like the math agent, frame requests as "The user wants to solve [complete problem]. Can you help with this?"
-                - Allow agents to break down problems themselves rather than pre-fragmenting tasks
-                - For each agent call, share the complete context and details from the user's question
-                - Let agents determine their own approach to solving problems within their domain
-                - Keep your final responses to users concise and focused on the answer, not the process
-                - In final responses to users, don't repeat the agent's full chain of reasoning unless specifically requested
-                - If you want to know more about what an agent can do, you are allowed to first ask the agent to describe its capabilities
-                """
-                debug_print("DEBUG: Adding system message to chat history")
-                chat_history.add_system_message(system_message)
-
-                # Add conversation history
-                debug_print("DEBUG: Adding conversation history to chat history")
-                for message in self.conversations[conversation_id]:
-                    if message["role"] == "user":
-                        chat_history.add_user_message(message["content"])
-                    elif message["role"] == "assistant":
-                        chat_history.add_assistant_message(message["content"])
-
-                # Get the chat service
-                debug_print("DEBUG: Getting chat service from kernel")
-                chat_service = self.kernel.get_service("chat-gpt")
-
-                # Set up function calling behavior
-                debug_print("DEBUG: Setting up function calling behavior")
-                settings = PromptExecutionSettings()
-                settings.function_choice_behavior = FunctionChoiceBehavior.Auto()
-
-                # Add a note to only use functions when absolutely necessary
-                settings.extension_data = {"function_call_guidance": "only_when_necessary"}
+                # Get the chat history for this conversation, now ending with this query
+                debug_print("DEBUG: Getting chat history for conversation")
+                chat_history = self.get_chat_history(conversation_id, query)
+
+                # Get the chat service and function calling settings resolved at kernel setup
+                chat_service = self._chat_service
+                if chat_service is None:
+                    raise RuntimeError("Chat service not available")
+                settings = self._default_settings
 
                 debug_print("Using Semantic Kernel for function calling")
 
@@ -632,44 +820,37 @@ class AgentRuntime:
 
                 # Process each chunk of the response as it arrives
                 debug_print("DEBUG: Processing streaming response")
-                full_response_content = ""
-                chunks = []
+                event_queue = current_event_queue.get()
+                # Chunk texts, joined once at the end rather than concatenated per chunk
+                parts = []
 
                 async for chunk in response_stream:
                     if chunk:
                         # Extract the chunk text
                         chunk_text = str(chunk)
-                        debug_print(f"DEBUG: Received streaming chunk: '{chunk_text}'")
-                        full_response_content += chunk_text
-                        chunks.append(chunk)
+                        debug_print("DEBUG: Received streaming chunk: '%s'", chunk_text)
+                        parts.append(chunk_text)
 
                         # Add each chunk to event queue for streaming to client
-                        debug_print(f"DEBUG: Putting chunk in event queue: '{chunk_text}'")
-                        await self.event_queue.put({
-                            "content": chunk_text
-                        })
-                        # Small sleep to ensure chunks are processed
-                        await asyncio.sleep(0.01)
+                        debug_print("DEBUG: Putting chunk in event queue: '%s'", chunk_text)
+                        event_queue.put_nowait(ContentChunk(chunk_text))
+
+                full_response_content = "".join(parts)
 
                 # Process the complete response
-                debug_print("DEBUG: Finished streaming, full response: {full_response_content}")
-
-                # Get the agents that were used
-                global last_called_agent
-                global last_agent_response
-                agents_used = []
-                if last_called_agent:
-                    debug_print(f"DEBUG: Adding last_called_agent to agents_used: {last_called_agent}")
-                    agents_used.append(last_called_agent)
-                    last_called_agent = None  # Reset for next query
-                    last_agent_response = None  # Reset the response
+                debug_print("DEBUG: Finished streaming, full response: %s", full_response_content)
+
+                # Get the agents that were used by this query alone
+                agents_used = called_agents.get()
+                debug_print("DEBUG: Agents used: %s", agents_used)
 
                 # Add to conversation history
-                debug_print("DEBUG: Adding assistant response to conversation history for {conversation_id}")
+                debug_print("DEBUG: Adding assistant response to conversation history for %s", conversation_id)
+                chat_history.add_assistant_message(full_response_content)
                 self.conversations[conversation_id].append({
                     "role": "assistant",
                     "content": full_response_content,
-                    "timestamp": datetime.datetime.now().isoformat(),
+                    "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
                     "agents_used": agents_used
                 })
 
@@ -688,7 +869,7 @@ class AgentRuntime:
                 debug_print("DEBUG: Semantic Kernel not available")
                 return {"error": "Semantic Kernel not available for processing"}
         except Exception as e:
-            debug_print(f"Error in processing query: {e}")
+            debug_print("Error in processing query: %s", e)
             return {"error": f"Error processing query: {e}"}
 
 
@@ -712,7 +893,7 @@ async def main():
     runtime = AgentRuntime()
 
     # Wait for kernel initialization
-    await asyncio.sleep(1)
+    await runtime.kernel_ready.wait()
 
     # Example queries
     queries = [
@@ -729,5 +910,13 @@ async def main():
         if "agents_used" in response:
             print(f"Selected agents: {response['agents_used']}")
 
+    await runtime.aclose()
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        import uvloop
+        loop_factory = uvloop.new_event_loop
+    except ImportError:
+        loop_factory = None
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        runner.run(main())
@@ -4,23 +4,85 @@
 
 import asyncio
 import datetime
-import json
 import logging
 import os
 import time
 import uuid
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from config import get_settings
-from database import get_db, create_conversation, get_conversation
+from database import get_db, create_conversation, delete_conversation, get_conversation
 from database.models import Message, Conversation, Session, User
-from database.session import get_or_create_anonymous_user
-from runtime.agent_runtime import AgentRuntime as BaseAgentRuntime, AgentPlugin
-from sqlalchemy import select
+from database.session import get_anonymous_user_id
+from runtime.agent_runtime import AgentRuntime as BaseAgentRuntime, AgentPlugin, ContentChunk
+from sqlalchemy import insert, select, tuple_, update
+from sqlalchemy.orm import load_only
 
 settings = get_settings()
 logger = logging.getLogger("enhanced_agent_runtime")
 
+# Streamed messages are written behind the response and committed in groups: the writer
+# takes whatever has queued up within WRITE_FLUSH_INTERVAL seconds, up to WRITE_BATCH_SIZE
+WRITE_BATCH_SIZE = 64
+WRITE_FLUSH_INTERVAL = 0.02
+
+# Conversation ids already confirmed to exist, so repeat turns skip the lookup
+KNOWN_CONVERSATIONS_SIZE = 4096
+
+# Message columns returned by the conversation history endpoint
+MESSAGE_HISTORY_COLUMNS = (
+    Message.id,
+    Message.role,
+    Message.content,
+    Message.sender_id,
+    Message.recipient_id,
+    Message.message_type,
+    Message.agents_used,
+    Message.execution_trace,
+    Message.extra_data,
+    Message.created_at,
+    Message.updated_at
+)
+
+# Queued to stop the message writer once everything before it is written
+WRITES_DONE = object()
+
+
+def utc_now() -> datetime.datetime:
+    """Current UTC time as a naive datetime, matching the DateTime columns."""
+    # Equivalent to datetime.utcnow(), which is deprecated from Python 3.12
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def message_row(
+    conversation_id: str,
+    role: str,
+    content: str,
+    created_at: datetime.datetime,
+    sender_id: Optional[str] = None,
+    recipient_id: Optional[str] = None,
+    agents_used: Optional[List[str]] = None,
+    execution_trace: Optional[List[Any]] = None
+) -> Dict[str, Any]:
+    """Column values for one Message insert, with the id and timestamps assigned up front.
+    
+    Every row carries the same keys so a batch goes out as a single executemany INSERT.
+    """
+    return {
+        "id": str(uuid.uuid4()),
+        "conversation_id": conversation_id,
+        "role": role,
+        "content": content,
+        "sender_id": sender_id,
+        "recipient_id": recipient_id,
+        "message_type": "text",
+        "agents_used": agents_used,
+        "execution_trace": execution_trace,
+        "created_at": created_at,
+        "updated_at": created_at
+    }
+
 
 class EnhancedAgentRuntime(BaseAgentRuntime):
     """Enhanced Agent Runtime with database persistence."""
@@ -28,83 +90,182 @@ class EnhancedAgentRuntime(BaseAgentRuntime):
     def __init__(self, config_path: str = None):
         super().__init__(config_path)
         self.db_conversations: Dict[str, str] = {}  # Map conversation_id to database conversation_id
+        self._write_queue: asyncio.Queue = asyncio.Queue()
+        self._writer_task: Optional[asyncio.Task] = None
+        self._known_conversations: "OrderedDict[str, None]" = OrderedDict()
+        if settings.profile_blocking:
+            self._monitor_blocking()
     
-    async def process_query_with_persistence(
+    def _monitor_blocking(self):
+        """Have asyncio log any callback that holds the loop past the blocking threshold.
+        
+        Debug mode times every callback step and warns through the asyncio logger, which
+        exposes synchronous calls (DNS, file I/O, a sync driver) stalling other requests.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            logger.warning("profile_blocking is set but the runtime was created outside an event loop")
+            return
+        loop.set_debug(True)
+        loop.slow_callback_duration = settings.blocking_threshold_ms / 1000
+        logging.getLogger("asyncio").setLevel(logging.WARNING)
+        logger.info(f"Logging event loop callbacks slower than {settings.blocking_threshold_ms:.1f}ms")
+    
+    def _write_behind(self, row: Dict[str, Any]):
+        """Queue a message row for the background writer, starting it on first use."""
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self._writer_loop())
+        self._write_queue.put_nowait(row)
+    
+    async def _writer_loop(self):
+        """Persist queued messages in group commits until the stop marker arrives."""
+        while True:
+            batch = [await self._write_queue.get()]
+            # Give concurrent requests a moment to land in the same commit
+            await asyncio.sleep(WRITE_FLUSH_INTERVAL)
+            while len(batch) < WRITE_BATCH_SIZE and not self._write_queue.empty():
+                batch.append(self._write_queue.get_nowait())
+            
+            rows = [item for item in batch if item is not WRITES_DONE]
+            if rows:
+                try:
+                    missing = await self._write_messages(rows)
+                    if missing:
+                        logger.warning(f"Dropped messages for deleted conversations: {', '.join(sorted(missing))}")
+                except Exception:
+                    # The writer must outlive a failed batch; the responses were already delivered
+                    logger.exception(f"Failed to persist {len(rows)} messages")
+            if len(rows) < len(batch):
+                return
+    
+    async def _write_messages(self, rows: List[Dict[str, Any]]) -> Set[str]:
+        """Insert message rows and bump their conversations' updated_at in one transaction.
+        
+        Rows whose conversation no longer exists are not written; the ids of those
+        conversations are returned and dropped from the known-conversation cache.
+        """
+        conversation_ids = {row["conversation_id"] for row in rows}
+        # Stamped from the same naive-UTC clock as created_at (SQLite's CURRENT_TIMESTAMP
+        # drops microseconds, and server now() may be local time), so ordering stays consistent
+        updated_at = max(row["created_at"] for row in rows)
+        missing: Set[str] = set()
+        
+        async with get_db() as db:
+            # Every touched conversation takes the batch's latest time in one UPDATE
+            result = await db.execute(
+                update(Conversation)
+                .where(Conversation.id.in_(conversation_ids))
+                .values(updated_at=updated_at)
+            )
+            # A cached conversation may since have been deleted by another worker or by
+            # session cleanup; its messages would otherwise be stored as orphans
+            if result.rowcount != len(conversation_ids):
+                existing = set((await db.execute(
+                    select(Conversation.id).where(Conversation.id.in_(conversation_ids))
+                )).scalars())
+                missing = conversation_ids - existing
+                for conversation_id in missing:
+                    self._known_conversations.pop(conversation_id, None)
+                rows = [row for row in rows if row["conversation_id"] in existing]
+            
+            if rows:
+                # Core INSERT skips the unit of work; all rows go out in one executemany
+                await db.execute(insert(Message), rows)
+            await db.commit()
+        return missing
+    
+    async def aclose(self):
+        """Write out any queued messages, then release the base runtime's resources."""
+        if self._writer_task is not None:
+            self._write_queue.put_nowait(WRITES_DONE)
+            await self._writer_task
+            self._writer_task = None
+        await super().aclose()
+    
+    async def _open_turn(
         self,
         query: str,
-        conversation_id: Optional[str] = None,
-        session_id: Optional[str] = None,
-        user_id: Optional[str] = None,
-        verbose: bool = False
-    ) -> Dict[str, Any]:
-        """Process a query with database persistence."""
+        conversation_id: Optional[str],
+        session_id: Optional[str],
+        user_id: Optional[str]
+    ) -> Tuple[str, str]:
+        """Resolve the user and conversation for a persisted turn, creating the conversation if needed."""
         async with get_db() as db:
-            # Get or create user
-            if user_id:
-                stmt = select(User).where(User.id == user_id)
-                result = await db.execute(stmt)
-                user = result.scalar_one_or_none()
-                if not user:
-                    user = await get_or_create_anonymous_user(db)
-            else:
-                user = await get_or_create_anonymous_user(db)
+            # Fall back to the anonymous user, whose id is cached after the first lookup
+            if not user_id:
+                user_id = await get_anonymous_user_id(db)
+            
+            # Get or create conversation. A cached id is only a hint that it exists;
+            # _write_messages finds out when it no longer does
+            if conversation_id in self._known_conversations:
+                self._known_conversations.move_to_end(conversation_id)
+                return user_id, conversation_id
             
-            # Get or create conversation
             db_conversation = None
             if conversation_id:
                 db_conversation = await get_conversation(db, conversation_id)
             
             if not db_conversation:
+                # Only a new conversation references the user row, so that is the one
+                # place a supplied id is checked; messages just record it as the sender
+                if await db.get(User, user_id) is None:
+                    user_id = await get_anonymous_user_id(db)
+                title = (query[:50] + "...") if len(query) > 50 else query
                 db_conversation = await create_conversation(
                     db,
                     session_id=session_id,
-                    user_id=user.id,
-                    title=query[:50] + "..." if len(query) > 50 else query
+                    user_id=user_id,
+                    title=title
                 )
-                conversation_id = db_conversation.id
-            
-            # Store user message
-            user_message = Message(
-                conversation_id=conversation_id,
-                role="user",
-                content=query,
-                sender_id=user.id,
-                message_type="text"
-            )
-            db.add(user_message)
-            await db.commit()
-            
-            # Process with base runtime
-            result = await super().process_query(
-                query=query,
-                conversation_id=conversation_id,
-                verbose=verbose
-            )
-            
-            # Store assistant response
-            assistant_message = Message(
-                conversation_id=conversation_id,
-                role="assistant",
-                content=result.get("content", ""),
-                sender_id="runtime",
-                recipient_id=user.id,
-                message_type="text",
-                agents_used=result.get("agents_used", []),
-                execution_trace=result.get("execution_trace", [])
-            )
-            db.add(assistant_message)
-            await db.commit()
-            
-            # Update conversation timestamp
-            db_conversation.updated_at = datetime.datetime.utcnow()
-            await db.commit()
-            
-            # Add database IDs to result
-            result["conversation_id"] = conversation_id
-            result["user_message_id"] = user_message.id
-            result["assistant_message_id"] = assistant_message.id
-            
-            return result
+            # Cache and hand on the stored id, not however the client spelled it
+            conversation_id = db_conversation.id
+        
+        self._known_conversations[conversation_id] = None
+        if len(self._known_conversations) > KNOWN_CONVERSATIONS_SIZE:
+            self._known_conversations.popitem(last=False)
+        return user_id, conversation_id
+    
+    async def process_query_with_persistence(
+        self,
+        query: str,
+        conversation_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        verbose: bool = False
+    ) -> Dict[str, Any]:
+        """Process a query with database persistence."""
+        user_id, conversation_id = await self._open_turn(query, conversation_id, session_id, user_id)
+        
+        # Process with base runtime; no connection is held while the model works
+        received_at = utc_now()
+        result = await super().process_query(
+            query=query,
+            conversation_id=conversation_id,
+            verbose=verbose
+        )
+        
+        # Store both messages and update the conversation timestamp in a single commit
+        user_row = message_row(conversation_id, "user", query, received_at, sender_id=user_id)
+        assistant_row = message_row(
+            conversation_id,
+            "assistant",
+            result.get("content", ""),
+            utc_now(),
+            sender_id="runtime",
+            recipient_id=user_id,
+            agents_used=result.get("agents_used", []),
+            execution_trace=result.get("execution_trace", [])
+        )
+        if await self._write_messages([user_row, assistant_row]):
+            raise LookupError(f"Conversation {conversation_id} was deleted while the query was processed")
+        
+        # Add database IDs to result
+        result["conversation_id"] = conversation_id
+        result["user_message_id"] = user_row["id"]
+        result["assistant_message_id"] = assistant_row["id"]
+        
+        return result
     
     async def stream_process_query_with_persistence(
         self,
@@ -114,101 +275,78 @@ class EnhancedAgentRuntime(BaseAgentRuntime):
         user_id: Optional[str] = None,
         verbose: bool = False
     ):
-        """Stream process query with database persistence."""
-        async with get_db() as db:
-            # Get or create user
-            if user_id:
-                stmt = select(User).where(User.id == user_id)
-                result = await db.execute(stmt)
-                user = result.scalar_one_or_none()
-                if not user:
-                    user = await get_or_create_anonymous_user(db)
-            else:
-                user = await get_or_create_anonymous_user(db)
-            
-            # Get or create conversation
-            db_conversation = None
-            if conversation_id:
-                db_conversation = await get_conversation(db, conversation_id)
-            
-            if not db_conversation:
-                db_conversation = await create_conversation(
-                    db,
-                    session_id=session_id,
-                    user_id=user.id,
-                    title=query[:50] + "..." if len(query) > 50 else query
-                )
-                conversation_id = db_conversation.id
+        """Stream process query with database persistence.
+        
+        Messages are handed to the background writer rather than committed inline, so
+        the stream never waits on the database and holds no connection while it runs.
+        """
+        user_id, conversation_id = await self._open_turn(query, conversation_id, session_id, user_id)
+        
+        # Store user message; ids and timestamps are assigned here since the insert comes later
+        user_row = message_row(conversation_id, "user", query, utc_now(), sender_id=user_id)
+        self._write_behind(user_row)
+        
+        # Collect the full response for database storage
+        response_parts: List[str] = []
+        agents_used = []
+        
+        # Stream process with base runtime
+        async for chunk in super().stream_process_query(
+            query=query,
+            conversation_id=conversation_id,
+            verbose=verbose
+        ):
+            # Model text, by far the most frequent event, takes the short path
+            if isinstance(chunk, ContentChunk):
+                response_parts.append(chunk.content)
+                yield chunk
+                continue
             
-            # Store user message
-            user_message = Message(
-                conversation_id=conversation_id,
-                role="user",
-                content=query,
-                sender_id=user.id,
-                message_type="text"
-            )
-            db.add(user_message)
-            await db.commit()
+            # Normalize plain text chunks so callers always receive an object
+            if not isinstance(chunk, dict):
+                chunk = {"content": str(chunk)}
             
-            # Collect the full response for database storage
-            full_response_content = ""
-            agents_used = []
+            # Yield chunk to client
+            yield chunk
             
-            # Stream process with base runtime
-            async for chunk in super().stream_process_query(
-                query=query,
-                conversation_id=conversation_id,
-                verbose=verbose
-            ):
-                # Yield chunk to client
-                yield chunk
+            # Collect response data
+            if "content" in chunk:
+                response_parts.append(str(chunk["content"]))
+            if "agents_used" in chunk:
+                agents_used = chunk["agents_used"]
+            if chunk.get("complete", False):
+                # Store final assistant response; the writer also bumps the conversation's updated_at
+                assistant_row = message_row(
+                    conversation_id,
+                    "assistant",
+                    "".join(response_parts),
+                    utc_now(),
+                    sender_id="runtime",
+                    recipient_id=user_id,
+                    agents_used=agents_used
+                )
+                self._write_behind(assistant_row)
+                
+                # Add database info to final chunk
+                chunk["user_message_id"] = user_row["id"]
+                chunk["assistant_message_id"] = assistant_row["id"]
                 
-                # Collect response data
-                if isinstance(chunk, dict):
-                    if "content" in chunk:
-                        full_response_content += str(chunk["content"])
-                    if "agents_used" in chunk:
-                        agents_used = chunk["agents_used"]
-                    if chunk.get("complete", False):
-                        # Store final assistant response
-                        assistant_message = Message(
-                            conversation_id=conversation_id,
-                            role="assistant",
-                            content=full_response_content,
-                            sender_id="runtime",
-                            recipient_id=user.id,
-                            message_type="text",
-                            agents_used=agents_used
-                        )
-                        db.add(assistant_message)
-                        
-                        # Update conversation timestamp
-                        db_conversation.updated_at = datetime.datetime.utcnow()
-                        await db.commit()
-                        
-                        # Add database info to final chunk
-                        chunk["user_message_id"] = user_message.id
-                        chunk["assistant_message_id"] = assistant_message.id
-                        
-                        yield chunk
+                yield chunk
     
     async def get_conversation_history_from_db(self, conversation_id: str) -> Optional[Dict[str, Any]]:
         """Get conversation history from database."""
         async with get_db() as db:
-            # Get conversation
             conversation = await get_conversation(db, conversation_id)
             if not conversation:
                 return None
             
-            # Get messages
+            # Plain column rows rather than ORM objects: nothing is hydrated or tracked
             stmt = (
-                select(Message)
-                .where(Message.conversation_id == conversation_id)
+                select(*MESSAGE_HISTORY_COLUMNS)
+                .where(Message.conversation_id == conversation.id)
                 .order_by(Message.created_at)
             )
-            result = await db.execute(stmt)
-            messages = result.scalars().all()
+            rows = (await db.execute(stmt)).all()
             
             return {
                 "id": conversation.id,
@@ -218,31 +356,48 @@ class EnhancedAgentRuntime(BaseAgentRuntime):
                 "extra_data": conversation.extra_data,
                 "messages": [
                     {
-                        "id": msg.id,
-                        "role": msg.role,
-                        "content": msg.content,
-                        "sender_id": msg.sender_id,
-                        "recipient_id": msg.recipient_id,
-                        "message_type": msg.message_type,
-                        "agents_used": msg.agents_used,
-                        "execution_trace": msg.execution_trace,
-                        "extra_data": msg.extra_data,
-                        "created_at": msg.created_at.isoformat(),
-                        "updated_at": msg.updated_at.isoformat()
+                        "id": row.id,
+                        "role": row.role,
+                        "content": row.content,
+                        "sender_id": row.sender_id,
+                        "recipient_id": row.recipient_id,
+                        "message_type": row.message_type,
+                        "agents_used": row.agents_used,
+                        "execution_trace": row.execution_trace,
+                        "extra_data": row.extra_data,
+                        "created_at": row.created_at.isoformat(),
+                        "updated_at": row.updated_at.isoformat()
                     }
-                    for msg in messages
+                    for row in rows
                 ]
             }
     
-    async def list_user_conversations(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """List conversations for a user."""
+    async def list_user_conversations(
+        self,
+        user_id: str,
+        limit: int = 50,
+        cursor: Optional[Tuple[datetime.datetime, str]] = None
+    ) -> List[Dict[str, Any]]:
+        """List conversations for a user, most recently updated first.
+        
+        Pass the (updated_at, id) of the last conversation returned as cursor to get the next
+        page; the id breaks ties between conversations committed in the same batch.
+        """
         async with get_db() as db:
             stmt = (
                 select(Conversation)
+                .options(load_only(
+                    Conversation.id,
+                    Conversation.title,
+                    Conversation.created_at,
+                    Conversation.updated_at,
+                    Conversation.extra_data
+                ))
                 .where(Conversation.user_id == user_id)
-                .order_by(Conversation.updated_at.desc())
-                .limit(limit)
             )
+            if cursor:
+                stmt = stmt.where(tuple_(Conversation.updated_at, Conversation.id) < cursor)
+            stmt = stmt.order_by(Conversation.updated_at.desc(), Conversation.id.desc()).limit(limit)
             result = await db.execute(stmt)
             conversations = result.scalars().all()
             
@@ -259,11 +414,6 @@ class EnhancedAgentRuntime(BaseAgentRuntime):
     
     async def delete_conversation(self, conversation_id: str) -> bool:
         """Delete a conversation and its messages."""
+        self._known_conversations.pop(conversation_id, None)
         async with get_db() as db:
-            conversation = await get_conversation(db, conversation_id)
-            if not conversation:
-                return False
-            
-            await db.delete(conversation)
-            await db.commit()
-            return True
\ No newline at end of file
+            return await delete_conversation(db, conversation_id)
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""Tests for SSE framing and frame coalescing."""
+
+import asyncio
+import unittest
+
+from api.sse import SSE_BATCH_BYTES, SSE_BATCH_DELAY, UrgentFrame, coalesce_frames, sse_event
+
+
+async def source(*frames, delay=0.0, closed=None):
+    """Yield frames, sleeping delay seconds before each; record closing in closed."""
+    try:
+        for frame in frames:
+            if delay:
+                await asyncio.sleep(delay)
+            yield frame
+    finally:
+        if closed is not None:
+            closed.append(True)
+
+
+async def collect(frames):
+    return [chunk async for chunk in coalesce_frames(frames)]
+
+
+class SseEventTests(unittest.TestCase):
+    def test_frames_payload_as_data_line(self):
+        self.assertEqual(sse_event({"content": "hi"}), b'data: {"content":"hi"}\n\n')
+        self.assertNotIsInstance(sse_event({"content": "hi"}), UrgentFrame)
+
+    def test_priority_events_are_urgent(self):
+        frame = sse_event({"agent_call": "hello-agent", "priority": True})
+        self.assertIsInstance(frame, UrgentFrame)
+        self.assertEqual(frame, b'data: {"agent_call":"hello-agent","priority":true}\n\n')
+
+
+class CoalesceFramesTests(unittest.IsolatedAsyncioTestCase):
+    async def test_end_of_stream_flushes_remaining_frames_in_one_write(self):
+        chunks = await collect(source(b"a", b"b", b"c"))
+        self.assertEqual(chunks, [b"abc"])
+
+    async def test_empty_source_writes_nothing(self):
+        self.assertEqual(await collect(source()), [])
+
+    async def test_flushes_when_batch_reaches_size(self):
+        big = b"x" * SSE_BATCH_BYTES
+        chunks = await collect(source(b"a", big, b"b"))
+        self.assertEqual(chunks, [b"a" + big, b"b"])
+
+    async def test_flushes_when_batch_delay_passes(self):
+        # The second frame arrives well after the first batch's window has closed
+        chunks = await collect(source(b"a", b"b", delay=SSE_BATCH_DELAY * 3))
+        self.assertEqual(chunks, [b"a", b"b"])
+
+    async def test_urgent_frame_flushes_batch_without_waiting(self):
+        async def handoff():
+            yield b"a"
+            yield UrgentFrame(b"!")
+            await asyncio.sleep(SSE_BATCH_DELAY * 10)
+            yield b"b"
+
+        loop = asyncio.get_running_loop()
+        stream = coalesce_frames(handoff())
+        started = loop.time()
+        first = await stream.__anext__()
+        self.assertEqual(first, b"a!")
+        self.assertLess(loop.time() - started, SSE_BATCH_DELAY)
+        self.assertEqual([chunk async for chunk in stream], [b"b"])
+
+    async def test_source_errors_propagate(self):
+        async def failing():
+            yield b"a"
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            await collect(failing())
+
+    async def test_source_is_closed_when_consumer_stops_early(self):
+        closed = []
+        stream = coalesce_frames(source(*([b"x" * SSE_BATCH_BYTES] * 200), closed=closed))
+        self.assertEqual(len(await stream.__anext__()), SSE_BATCH_BYTES)
+        await stream.aclose()
+        self.assertEqual(closed, [True])
+
+    async def test_source_is_closed_when_consumer_is_cancelled(self):
+        closed = []
+        started = asyncio.Event()
+
+        async def consume():
+            async for _ in coalesce_frames(source(b"a", *([b"b"] * 10), delay=1.0, closed=closed)):
+                started.set()
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(SSE_BATCH_DELAY)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertFalse(started.is_set())
+        self.assertEqual(closed, [True])
+
+    async def test_frames_are_pulled_by_one_task(self):
+        tasks = set()
+
+        async def recording():
+            for frame in (b"a", b"b", b"c"):
+                tasks.add(asyncio.current_task())
+                yield frame
+
+        await collect(recording())
+        self.assertEqual(len(tasks), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()